@@ -0,0 +1,147 @@
+#Non-interactive bulk mode for answering large numbers of access queries.
+#Queries are streamed from a file (or stdin) and decisions are streamed to stdout, chunk by chunk,
+#in the order the queries were given. Two formats are understood:
+#   csv    one resource,accessor,permission per line, answered as resource,accessor,permission,decision
+#          where decision is granted, denied or error: <message>
+#   jsonl  one {"resource": ..., "accessor": ..., "permission": ...} object per line, answered with the
+#          same object plus "granted" (or "error")
+#Permissions can be given as names or characters. Every chunk of queries is answered with
+#driver.decideBatch, which shares one evaluation between queries evaluated against the same
+#policy, owner and permission. Chunks can be spread across worker processes.
+
+import csv, json, sys, time
+import parallel
+from driver import decideBatch, permissionCharacters
+
+#one query read from the input
+#query is the (resource, accessor, permission character) to decide, or None if the line was invalid,
+#in which case error says why
+class BatchQuery:
+    def __init__(self, fields, query, error = None):
+        self.fields = fields    #the query as read, echoed back in the output
+        self.query = query
+        self.error = error
+
+#reads queries from input, yielding BatchQuery objects
+#format is "csv" or "jsonl"
+def readQueries(input, format, permissions, resources):
+    permissionChars = permissionCharacters(permissions)
+    if format == "csv":
+        rows = csv.reader(input)
+    else:
+        rows = (line for line in input if line.strip())
+
+    for row in rows:
+        if format == "csv":
+            if not row or (len(row) == 1 and not row[0].strip()):
+                continue
+            if len(row) != 3:
+                yield BatchQuery(row, None, "expected resource,accessor,permission")
+                continue
+            fields = row
+            resource, accessor, permission = [field.strip() for field in row]
+        else:
+            try:
+                fields = json.loads(row)
+                resource, accessor, permission = fields["resource"], fields["accessor"], fields["permission"]
+            except (ValueError, KeyError, TypeError) as e:
+                yield BatchQuery({"line": row.rstrip("\n")}, None, "invalid query: {}".format(e))
+                continue
+            if not all(type(field) is str for field in (resource, accessor, permission)):
+                yield BatchQuery(fields, None, "invalid query: resource, accessor and permission must be strings")
+                continue
+
+        if resource not in resources:
+            yield BatchQuery(fields, None, "{} is not an existing resource".format(resource))
+        elif permission in permissionChars:
+            yield BatchQuery(fields, (resource, accessor, permissionChars[permission]))
+        elif permission in permissions:
+            yield BatchQuery(fields, (resource, accessor, permission))
+        else:
+            yield BatchQuery(fields, None, "{} is not an existing permission".format(permission))
+
+#yields lists of up to chunkSize items from items
+def chunked(items, chunkSize):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunkSize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+#answers the valid queries in a chunk of (resource, accessor, permission) against the worker's state
+def decideSharedChunk(queries):
+    resources, socialNetwork, nodes, permissions = parallel.sharedState
+    return decideBatch(queries, socialNetwork, resources, nodes)
+
+#answers every query read from input, writing decisions to output as chunks are answered
+#workers = number of worker processes (threads for a PartitionedGraph) to spread chunks across, 0 to answer them in this process
+#summary = where to print the throughput summary when done, None for no summary
+def runBatch(input, output, format, permissions, socialNetwork, nodes, resources, chunkSize = 10000, workers = 0, summary = sys.stderr):
+    start = time.perf_counter()
+    counts = {"granted": 0, "denied": 0, "error": 0}
+    chunks = chunked(readQueries(input, format, permissions, resources), chunkSize)
+    writer = csv.writer(output, lineterminator = "\n") if format == "csv" else None
+
+    def writeChunk(chunk, decisions):
+        decisions = iter(decisions)
+        for batchQuery in chunk:
+            if batchQuery.query is None:
+                counts["error"] += 1
+                decision = None
+            else:
+                decision = next(decisions)
+                counts["granted" if decision else "denied"] += 1
+            writeDecision(writer, output, batchQuery, decision)
+        output.flush()
+
+    state = (resources, socialNetwork, nodes, permissions)
+    if workers > 0:
+        with parallel.sharedStatePool(state, workers) as pool:
+            #keep a bounded number of chunks in flight, and write them back in order
+            inFlight = []
+            for chunk in chunks:
+                inFlight.append((chunk, pool.submit(decideSharedChunk, validQueries(chunk))))
+                if len(inFlight) >= workers * 2:
+                    chunk, future = inFlight.pop(0)
+                    writeChunk(chunk, future.result())
+            for chunk, future in inFlight:
+                writeChunk(chunk, future.result())
+    else:
+        for chunk in chunks:
+            writeChunk(chunk, decideBatch(validQueries(chunk), socialNetwork, resources, nodes))
+
+    elapsed = time.perf_counter() - start
+    total = counts["granted"] + counts["denied"] + counts["error"]
+    if summary is not None:
+        rate = total / elapsed if elapsed > 0 else 0.0
+        print("{} queries in {:.3f}s ({:.0f} queries/s): {} granted, {} denied, {} errors".format(
+            total, elapsed, rate, counts["granted"], counts["denied"], counts["error"]), file = summary)
+    return counts
+
+def validQueries(chunk):
+    return [batchQuery.query for batchQuery in chunk if batchQuery.query is not None]
+
+#writes the answer to batchQuery, decision is None for invalid queries
+def writeDecision(writer, output, batchQuery, decision):
+    if writer is not None:
+        if batchQuery.error is not None:
+            writer.writerow(list(batchQuery.fields) + ["error: " + batchQuery.error])
+        else:
+            writer.writerow(list(batchQuery.fields) + ["granted" if decision else "denied"])
+        return
+
+    answer = dict(batchQuery.fields)
+    if batchQuery.error is not None:
+        answer["error"] = batchQuery.error
+    else:
+        answer["granted"] = decision
+    output.write(json.dumps(answer) + "\n")
+
+#returns the format of the batch input at path, from its extension ("-" for stdin defaults to csv)
+def guessFormat(path):
+    if path.endswith(".jsonl") or path.endswith(".ndjson") or path.endswith(".json"):
+        return "jsonl"
+    return "csv"
@@ -0,0 +1,313 @@
+#Benchmark suite for preprocessing and access queries on synthetic social networks.
+#
+#Policy files are generated from a seed: a power law social network grown by preferential
+#attachment (new people link to existing people with probability proportional to how many
+#relationships they already have), resources owned mostly by well connected people, policies mixing
+#T, a, !a and relationship paths of varied length, some negated, and delegations that are valid by
+#construction.
+#Every phase is timed with time.perf_counter and reported as count, mean, min, max and p50/p95/p99:
+#   preprocess  preprocessing the generated policy file, repeated --trials times
+#   cold        single hasAccess queries without any cache
+#   warm        the same queries through an AccessCache that has already seen them
+#   batch       decideBatch over chunks of --chunk-size queries, per chunk
+#Results are written as JSON, and can be compared against a previous run to catch regressions.
+#
+#usage: python bench.py --people 1000 100000 [--resources N] [--queries N] [--output results.json]
+#                       [--compare baseline.json]
+
+import argparse, json, os, platform, random, sys, tempfile, time
+from driver import preprocess, hasAccess, decideBatch
+from cache import AccessCache
+
+LABELS = ["friend", "parent", "sibling", "spouse", "coworker"]
+LABEL_WEIGHTS = [5, 2, 2, 1, 3]
+PERMISSIONS = {"r": "read", "w": "write", "x": "execute"}
+
+#describes the synthetic policy files to generate
+class GeneratorConfig:
+    def __init__(self, people, seed = 0, edgesPerPerson = 3, resources = 100, maxPathLength = 3,
+                 negationRate = 0.1, delegationRate = 0.3, statementsPerPolicy = 4):
+        self.people = people
+        self.seed = seed
+        self.edgesPerPerson = edgesPerPerson
+        self.resources = resources
+        self.maxPathLength = maxPathLength
+        self.negationRate = negationRate
+        self.delegationRate = delegationRate
+        self.statementsPerPolicy = statementsPerPolicy
+
+    def toDict(self):
+        return dict(self.__dict__)
+
+#returns the edges (label, left, right) of a power law social network over config.people people
+def generateEdges(config, generator):
+    edges = []
+    endpoints = []      #every person appears once per relationship they are in
+    seedPeople = min(config.people, config.edgesPerPerson + 1)
+    for i in range(seedPeople):
+        for j in range(i):
+            edges.append((generator.choices(LABELS, LABEL_WEIGHTS)[0], i, j))
+            endpoints.extend((i, j))
+
+    for person in range(seedPeople, config.people):
+        targets = set()
+        while len(targets) < config.edgesPerPerson:
+            targets.add(generator.choice(endpoints))
+        for target in targets:
+            if generator.random() < 0.5:
+                edges.append((generator.choices(LABELS, LABEL_WEIGHTS)[0], person, target))
+            else:
+                edges.append((generator.choices(LABELS, LABEL_WEIGHTS)[0], target, person))
+            endpoints.extend((person, target))
+    return edges, endpoints
+
+#returns a random relationship path of 1 to config.maxPathLength hops, e.g. <friend><-parent>
+def randomPath(config, generator):
+    hops = generator.randint(1, config.maxPathLength)
+    return "".join("<{}{}>".format("-" if generator.random() < 0.3 else "", generator.choices(LABELS, LABEL_WEIGHTS)[0])
+                   for i in range(hops))
+
+def randomPermissions(generator):
+    return "".join(sorted(generator.sample(list(PERMISSIONS), generator.randint(1, len(PERMISSIONS)))))
+
+#returns the resources dict of a generated policy file
+def generateResources(config, generator, edges, endpoints):
+    #people each person has an incoming relationship from, by label, used to build valid delegations
+    incoming = {}
+    for label, left, right in edges:
+        incoming.setdefault((right, label), []).append(left)
+
+    resources = {}
+    for i in range(config.resources):
+        owner = generator.choice(endpoints)
+        statements = []
+        for j in range(config.statementsPerPolicy):
+            kind = generator.random()
+            if kind < 0.1:
+                statements.append("T({})".format(generator.choice(list(PERMISSIONS))))
+            elif kind < 0.2:
+                statements.append("a({})".format(randomPermissions(generator)))
+            elif kind < 0.25:
+                statements.append("!a({})".format(generator.choice(list(PERMISSIONS))))
+            else:
+                negation = "!" if generator.random() < config.negationRate else ""
+                statements.append("{}{}a({})".format(negation, randomPath(config, generator), randomPermissions(generator)))
+
+        delegations = {}
+        if generator.random() < config.delegationRate:
+            #someone the owner is related to through label gets permissions through <label>a, and may
+            #delegate them through $(<label>a)
+            label = generator.choices(LABELS, LABEL_WEIGHTS)[0]
+            candidates = incoming.get((owner, label), [])
+            if candidates:
+                permissions = randomPermissions(generator)
+                statements.append("<{}>a({})".format(label, permissions))
+                statements.append("$(<{}>a)".format(label))
+                for delegator in set(generator.sample(candidates, min(3, len(candidates)))):
+                    delegates = "".join(sorted(generator.sample(permissions, generator.randint(1, len(permissions)))))
+                    delegations["P{}".format(delegator)] = {"delegates": "{}d({})".format(randomPath(config, generator), delegates)}
+
+        resources["resource{}.txt".format(i)] = {"owner": "P{}".format(owner), "policy": "|".join(statements), "delegations": delegations}
+    return resources
+
+#writes a generated policy file to path
+#returns the path of the edge list file it uses (or None) and the number of relationships generated
+#with edgeFile the relationships are written to a sidecar edge list instead of the policy file
+#(see stream.py), which keeps very large networks out of the JSON
+def generatePolicyFile(config, path, edgeFile = False):
+    generator = random.Random(config.seed)
+    edges, endpoints = generateEdges(config, generator)
+    fileDict = {"resources": generateResources(config, generator, edges, endpoints), "permission types": PERMISSIONS}
+
+    edgePath = None
+    if edgeFile:
+        edgePath = path + ".tsv"
+        with open(edgePath, "w") as f:
+            for label, left, right in edges:
+                f.write("{}\tP{}\tP{}\n".format(label, left, right))
+    else:
+        relationships = {}
+        for label, left, right in edges:
+            relationships.setdefault(label, []).append("P{}, P{}".format(left, right))
+        fileDict["relationships"] = relationships
+
+    with open(path, "w") as f:
+        json.dump(fileDict, f)
+    return edgePath, len(edges)
+
+#returns count random (resource, accessor, permission) queries against resources
+#half of the accessors are people related to the owner, so queries are not all trivially denied
+def generateQueries(count, resources, socialNetwork, nodes, seed):
+    generator = random.Random(seed)
+    resourceNames = sorted(resources)
+    names = sorted(nodes)
+    queries = []
+    for i in range(count):
+        resource = generator.choice(resourceNames)
+        owner = resources[resource]["owner"]
+        accessor = generator.choice(names)
+        if generator.random() < 0.5 and owner in nodes:
+            label = generator.choice(LABELS)
+            neighbors = socialNetwork.neighbors(nodes[owner], generator.choice([label, "-" + label]))
+            if neighbors:
+                accessor = generator.choice(neighbors).name
+        queries.append((resource, accessor, generator.choice(list(PERMISSIONS))))
+    return queries
+
+#returns count, mean, min, max and p50/p95/p99 of a list of durations in seconds
+def summarize(durations):
+    durations = sorted(durations)
+    if not durations:
+        return {"count": 0}
+    def percentile(p):
+        return durations[min(len(durations) - 1, int(len(durations) * p / 100))]
+    return {
+        "count": len(durations),
+        "mean": sum(durations) / len(durations),
+        "min": durations[0],
+        "max": durations[-1],
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99)
+    }
+
+#returns the durations of calling function once per item of items
+def timeEach(function, items):
+    durations = []
+    for item in items:
+        start = time.perf_counter()
+        function(item)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+#runs every phase against one generated policy file, returns the results of each phase
+def benchmark(config, directory, trials, queryCount, chunkSize, edgeFile = False, engine = "dict"):
+    path = os.path.join(directory, "bench-{}-{}.json".format(config.people, config.seed))
+    start = time.perf_counter()
+    edgePath, edgeCount = generatePolicyFile(config, path, edgeFile)
+    generateSeconds = time.perf_counter() - start
+
+    preprocessTimes = []
+    socialNetwork = None
+    for trial in range(trials):
+        #only the graph of the last trial is queried, stop the shards of a partitioned one
+        closeGraph(socialNetwork)
+        start = time.perf_counter()
+        permissions, socialNetwork, nodes, resources = preprocess(path, engine = engine, edgeFile = edgePath)
+        preprocessTimes.append(time.perf_counter() - start)
+
+    queries = generateQueries(queryCount, resources, socialNetwork, nodes, config.seed)
+
+    def query(q):
+        hasAccess(q[0], q[1], q[2], socialNetwork, resources, nodes)
+    cold = timeEach(query, queries)
+
+    cache = AccessCache(maxDecisions = max(1, queryCount), maxRelationships = max(1, queryCount))
+    def cachedQuery(q):
+        hasAccess(q[0], q[1], q[2], socialNetwork, resources, nodes, cache = cache)
+    timeEach(cachedQuery, queries)
+    warm = timeEach(cachedQuery, queries)
+
+    chunks = [queries[i:i + chunkSize] for i in range(0, len(queries), chunkSize)]
+    batch = timeEach(lambda chunk: decideBatch(chunk, socialNetwork, resources, nodes), chunks)
+
+    granted = sum(1 for q in queries if hasAccess(q[0], q[1], q[2], socialNetwork, resources, nodes))
+    closeGraph(socialNetwork)
+    return {
+        "config": config.toDict(),
+        "engine": engine,
+        "edges": edgeCount,
+        "generateSeconds": generateSeconds,
+        "grantedFraction": granted / len(queries) if queries else 0.0,
+        "phases": {
+            "preprocess": summarize(preprocessTimes),
+            "cold": summarize(cold),
+            "warm": summarize(warm),
+            "batch": summarize(batch)
+        },
+        "batchChunkSize": chunkSize
+    }
+
+#stops the worker processes behind socialNetwork, if it has any
+def closeGraph(socialNetwork):
+    if hasattr(socialNetwork, "close"):
+        socialNetwork.close()
+
+#compares the results of a run against those of a baseline run, phase by phase
+#returns the list of regressions, where the p50 of a phase grew by more than threshold (e.g. 0.2 = 20%)
+def compareResults(results, baseline, threshold, output = sys.stdout):
+    baselineRuns = {(run["config"]["people"], run["config"]["seed"], run["engine"]): run for run in baseline["runs"]}
+    regressions = []
+    for run in results["runs"]:
+        key = (run["config"]["people"], run["config"]["seed"], run["engine"])
+        if key not in baselineRuns:
+            continue
+        for phase, summary in run["phases"].items():
+            before = baselineRuns[key]["phases"].get(phase, {}).get("p50")
+            after = summary.get("p50")
+            if not before or after is None:
+                continue
+            ratio = after / before
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions.append((key, phase, ratio))
+            print("{:>10} people {:>10}: p50 {:.6f}s -> {:.6f}s ({:.2f}x){}".format(key[0], phase, before, after, ratio, flag), file = output)
+    return regressions
+
+def printRun(run, output = sys.stdout):
+    print("{} people, {} relationships, {} resources ({} engine)".format(
+        run["config"]["people"], run["edges"], run["config"]["resources"], run["engine"]), file = output)
+    for phase, summary in run["phases"].items():
+        if summary["count"] == 0:
+            continue
+        print("  {:>10}: n={:<6} p50={:.6f}s p95={:.6f}s p99={:.6f}s".format(
+            phase, summary["count"], summary["p50"], summary["p95"], summary["p99"]), file = output)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark preprocessing and queries on synthetic social networks")
+    parser.add_argument("--people", type = int, nargs = "+", default = [1000, 10000], help = "network sizes to benchmark, 10^3 to 10^7")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--edges-per-person", type = int, default = 3)
+    parser.add_argument("--resources", type = int, default = 100)
+    parser.add_argument("--max-path-length", type = int, default = 3)
+    parser.add_argument("--negation-rate", type = float, default = 0.1)
+    parser.add_argument("--delegation-rate", type = float, default = 0.3)
+    parser.add_argument("--trials", type = int, default = 3, help = "times to preprocess each policy file")
+    parser.add_argument("--queries", type = int, default = 2000)
+    parser.add_argument("--chunk-size", type = int, default = 100, help = "queries per batch")
+    parser.add_argument("--engine", choices = ["dict", "csr", "partitioned"], default = "dict")
+    parser.add_argument("--edge-file", action = "store_true", help = "write relationships to a sidecar edge list, for very large networks")
+    parser.add_argument("--directory", help = "where to write generated policy files, a temporary directory by default")
+    parser.add_argument("--output", help = "file to write the JSON results to")
+    parser.add_argument("--compare", help = "JSON results of a previous run to compare against")
+    parser.add_argument("--threshold", type = float, default = 0.2, help = "p50 slowdown counted as a regression")
+    args = parser.parse_args()
+
+    results = {
+        "python": sys.version,
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "runs": []
+    }
+    with tempfile.TemporaryDirectory() as temporary:
+        directory = args.directory if args.directory is not None else temporary
+        for people in args.people:
+            config = GeneratorConfig(people, args.seed, args.edges_per_person, args.resources, args.max_path_length,
+                                     args.negation_rate, args.delegation_rate)
+            run = benchmark(config, directory, args.trials, args.queries, args.chunk_size, args.edge_file, args.engine)
+            printRun(run)
+            results["runs"].append(run)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 2)
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if compareResults(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#Caches used to avoid repeating graph traversals for queries that have already been answered.
+#Every entry is stored together with the version of the data it was computed from. A lookup
+#made with a different version is treated as a miss, so entries go stale on their own when
+#the social network or a policy changes and never need to be cleared by hand.
+
+from collections import OrderedDict
+
+#a bounded least recently used cache that keeps hit/miss/eviction counts
+class LRUCache:
+    def __init__(self, maxSize):
+        if maxSize < 1:
+            raise ValueError("LRUCache must be able to hold at least one entry")
+        self.maxSize = maxSize
+        self.entries = OrderedDict()    #maps key to (version, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    #returns (True, value) if key is cached for version, (False, None) otherwise
+    def get(self, key, version):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    #caches value for key as computed under version, evicting the least recently used entry if full
+    def put(self, key, version, value):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        self.entries[key] = (version, value)
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last = False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxSize": self.maxSize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": self.hits / lookups if lookups else 0.0
+        }
+
+#the caches consulted by driver.hasAccess and driver.relatedVia
+#decisions maps (resource, accessor, permission) to the answer of hasAccess
+#relationships maps (labels, anchor, accessor) to whether the labels connect anchor to accessor
+class AccessCache:
+    def __init__(self, maxDecisions = 100000, maxRelationships = 100000):
+        self.decisions = LRUCache(maxDecisions)
+        self.relationships = LRUCache(maxRelationships)
+
+    def clear(self):
+        self.decisions.clear()
+        self.relationships.clear()
+
+    def stats(self):
+        return {"decisions": self.decisions.stats(), "relationships": self.relationships.stats()}
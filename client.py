@@ -0,0 +1,90 @@
+#Load testing client for the decision server (see server.py).
+#Sends random queries, built from the resources, people and permissions of a policy file, over
+#several connections at once. Every connection pipelines all of its requests without waiting for
+#answers, then the throughput and latency of the answers are reported.
+#
+#usage: python client.py policyFile [--host HOST --port PORT | --unix PATH] [--requests N] [--connections N]
+
+import argparse, asyncio, json, random, time
+
+#returns count random query dicts drawn from the policy file filename
+def randomQueries(filename, count, seed):
+    with open(filename, "r") as policyFile:
+        fileDict = json.load(policyFile)
+    resources = list(fileDict["resources"])
+    permissions = list(fileDict["permission types"].values())
+    people = set()
+    for relationships in fileDict["relationships"].values():
+        for relationship in relationships:
+            for name in relationship.split(","):
+                people.add(name.strip())
+    people = sorted(people)
+
+    generator = random.Random(seed)
+    return [{"id": i, "resource": generator.choice(resources), "accessor": generator.choice(people),
+             "permission": generator.choice(permissions)} for i in range(count)]
+
+#sends queries over one connection, returns the latency in seconds of every answer and the answers
+async def runConnection(queries, host, port, path):
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    sent = {}
+    async def send():
+        for query in queries:
+            sent[query["id"]] = time.perf_counter()
+            writer.write((json.dumps(query) + "\n").encode("utf-8"))
+            await writer.drain()
+    sending = asyncio.ensure_future(send())
+
+    latencies = []
+    answers = []
+    for i in range(len(queries)):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection after {} answers".format(i))
+        answer = json.loads(line)
+        latencies.append(time.perf_counter() - sent[answer["id"]])
+        answers.append(answer)
+    await sending
+    writer.close()
+    return latencies, answers
+
+#returns the pth percentile of the sorted list values
+def percentile(values, p):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+async def loadTest(queries, connections, host, port, path):
+    start = time.perf_counter()
+    results = await asyncio.gather(*[runConnection(queries[i::connections], host, port, path) for i in range(connections)])
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for connectionLatencies, answers in results for latency in connectionLatencies)
+    answers = [answer for connectionLatencies, answers in results for answer in answers]
+    granted = sum(1 for answer in answers if answer.get("granted"))
+    errors = sum(1 for answer in answers if "error" in answer)
+    print("{} queries over {} connections in {:.3f}s ({:.0f} queries/s)".format(len(queries), connections, elapsed, len(queries) / elapsed))
+    print("granted: {}  denied: {}  errors: {}".format(granted, len(answers) - granted - errors, errors))
+    print("latency p50: {:.2f}ms  p95: {:.2f}ms  p99: {:.2f}ms".format(
+        percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000, percentile(latencies, 99) * 1000))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Load test a decision server")
+    parser.add_argument("policyFile", help = "policy file the queries are drawn from")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--unix", help = "unix socket path of the server, instead of host and port")
+    parser.add_argument("--requests", type = int, default = 10000)
+    parser.add_argument("--connections", type = int, default = 4)
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    queries = randomQueries(args.policyFile, args.requests, args.seed)
+    asyncio.run(loadTest(queries, args.connections, args.host, args.port, args.unix))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#An alternate social network graph for very large networks, with the same query methods as Graph.
+#People are interned to dense integer ids and labels to small integer ids. For every label the
+#edges are stored as two CSR (compressed sparse row) arrays built with NumPy:
+#   forward[label]  = (indptr, indices), the ids indices[indptr[i]:indptr[i + 1]] are the people
+#                     person i has relationship label with (followed by -<label>)
+#   backward[label] = (indptr, indices), the people who have relationship label with person i
+#                     (followed by <label>)
+#Each hop of a relationship path is a vectorized expansion of a frontier of ids, so no per edge
+#objects are created at all.
+#Edges are collected in flat arrays as they are added or removed, and the CSR arrays are rebuilt
+#the next time the graph is queried. Like Graph, a relationship is only stored once: duplicates
+#are dropped from the flat arrays when they are next built.
+
+from array import array
+import numpy as np
+from graph import Node, OUTGOING, parseEdgeType, reverseEdgeType, labelVersions, LabelStatistics, GraphStatistics
+
+class CSRGraph:
+    def __init__(self):
+        self.ids = {}               #maps name to id
+        self.people = []            #maps id to Node
+        self.labels = {}            #maps label to label id
+        self.labelNames = []        #maps label id to label
+        self.edgeLabels = array("i")    #the label id, left id and right id of every edge
+        self.edgeLefts = array("i")
+        self.edgeRights = array("i")
+        self.edgeCounts = array("i")    #maps id to the number of edges touching that person
+        self.labelCounts = array("i")   #maps label id to the number of edges of that label
+        self.forward = []
+        self.backward = []
+        self.built = True
+        self.version = 0
+        self.labelsVersion = next(labelVersions)    #see Graph
+        self.statistics = None
+        self.observers = []
+
+    #returns the id of node, interning it if it has not been seen before
+    def intern(self, node):
+        id = self.ids.get(node.name)
+        if id is None:
+            id = len(self.people)
+            self.ids[node.name] = id
+            self.people.append(node)
+            self.edgeCounts.append(0)
+        return id
+
+    #returns the id of label, interning it if it has not been seen before
+    def internLabel(self, label):
+        labelId = self.labels.get(label)
+        if labelId is None:
+            labelId = len(self.labelNames)
+            self.labels[label] = labelId
+            self.labelNames.append(label)
+            self.labelCounts.append(0)
+        return labelId
+
+    #add a new edge to the graph, indicating that node1 has relationship <relationshipIdentifier> with node2
+    def addEdge(self, relationshipIdentifier, node1, node2):
+        left = self.intern(node1)
+        right = self.intern(node2)
+        labelId = self.internLabel(relationshipIdentifier)
+        self.edgeLabels.append(labelId)
+        self.edgeLefts.append(left)
+        self.edgeRights.append(right)
+        self.edgeCounts[left] += 1
+        self.edgeCounts[right] += 1
+        if self.labelCounts[labelId] == 0:
+            self.labelsVersion = next(labelVersions)
+        self.labelCounts[labelId] += 1
+        self.built = False
+        self.version += 1
+        for observer in self.observers:
+            observer.edgeAdded(relationshipIdentifier, node1, node2)
+
+    #remove the edge indicating that node1 has relationship <relationshipIdentifier> with node2,
+    #with any duplicates of it not dropped yet
+    #returns whether such an edge existed
+    def removeEdge(self, relationshipIdentifier, node1, node2):
+        if relationshipIdentifier not in self.labels or not self.hasNode(node1) or not self.hasNode(node2):
+            return False
+        left = self.ids[node1.name]
+        right = self.ids[node2.name]
+        labelId = self.labels[relationshipIdentifier]
+        matches = ((np.frombuffer(self.edgeLabels, dtype = np.int32) == labelId)
+                   & (np.frombuffer(self.edgeLefts, dtype = np.int32) == left)
+                   & (np.frombuffer(self.edgeRights, dtype = np.int32) == right))
+        count = int(np.count_nonzero(matches))
+        if count == 0:
+            return False
+        self.keepEdges(~matches)
+        self.edgeCounts[left] -= count
+        self.edgeCounts[right] -= count
+        self.labelCounts[labelId] -= count
+        self.built = False
+        self.version += 1
+        for observer in self.observers:
+            observer.edgeRemoved(relationshipIdentifier, node1, node2)
+        return True
+
+    #see Graph.addObserver. loadEdges replaces the graph without telling observers
+    def addObserver(self, observer):
+        self.observers.append(observer)
+
+    def removeObserver(self, observer):
+        self.observers.remove(observer)
+
+    #replaces the contents of the graph with the edges in the flat id arrays edgeLabels, edgeLefts and
+    #edgeRights, where ids index into names and label ids index into labels
+    #returns the dict mapping names to Node objects
+    def loadEdges(self, names, labels, edgeLabels, edgeLefts, edgeRights):
+        self.people = [Node(name) for name in names]
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.labelNames = list(labels)
+        self.labels = {label: i for i, label in enumerate(labels)}
+        self.edgeLabels = array("i", edgeLabels)
+        self.edgeLefts = array("i", edgeLefts)
+        self.edgeRights = array("i", edgeRights)
+        counts = np.bincount(np.frombuffer(self.edgeLefts, dtype = np.int32), minlength = len(names))
+        counts = counts + np.bincount(np.frombuffer(self.edgeRights, dtype = np.int32), minlength = len(names))
+        self.edgeCounts = array("i", counts.astype(np.int32).tobytes())
+        counts = np.bincount(np.frombuffer(self.edgeLabels, dtype = np.int32), minlength = len(labels))
+        self.labelCounts = array("i", counts.astype(np.int32).tobytes())
+        self.built = False
+        self.version += 1
+        self.labelsVersion = next(labelVersions)
+        return {person.name: person for person in self.people if self.hasNode(person)}
+
+    #replaces the flat edge arrays with the edges where the boolean array keep is True
+    def keepEdges(self, keep):
+        self.edgeLabels = array("i", np.frombuffer(self.edgeLabels, dtype = np.int32)[keep].tobytes())
+        self.edgeLefts = array("i", np.frombuffer(self.edgeLefts, dtype = np.int32)[keep].tobytes())
+        self.edgeRights = array("i", np.frombuffer(self.edgeRights, dtype = np.int32)[keep].tobytes())
+
+    #drops every edge but the first of each relationship from the flat edge arrays
+    def deduplicate(self):
+        if len(self.edgeLabels) == 0:
+            return
+        edges = np.stack([np.frombuffer(self.edgeLabels, dtype = np.int32),
+                          np.frombuffer(self.edgeLefts, dtype = np.int32),
+                          np.frombuffer(self.edgeRights, dtype = np.int32)], axis = 1)
+        first = np.unique(edges, axis = 0, return_index = True)[1]
+        if len(first) == len(edges):
+            return
+        keep = np.zeros(len(edges), dtype = bool)
+        keep[first] = True
+        edges = None
+        self.keepEdges(keep)
+        lefts = np.frombuffer(self.edgeLefts, dtype = np.int32)
+        rights = np.frombuffer(self.edgeRights, dtype = np.int32)
+        counts = np.bincount(lefts, minlength = len(self.people)) + np.bincount(rights, minlength = len(self.people))
+        self.edgeCounts = array("i", counts.astype(np.int32).tobytes())
+        counts = np.bincount(np.frombuffer(self.edgeLabels, dtype = np.int32), minlength = len(self.labelNames))
+        self.labelCounts = array("i", counts.astype(np.int32).tobytes())
+
+    #returns every edge of the graph as (label, left node, right node), once per edge
+    def edgeList(self):
+        self.deduplicate()
+        return [(self.labelNames[self.edgeLabels[i]], self.people[self.edgeLefts[i]], self.people[self.edgeRights[i]])
+                for i in range(len(self.edgeLabels))]
+
+    #whether node has at least one relationship in the graph
+    def hasNode(self, node):
+        id = self.ids.get(node.name)
+        return id is not None and self.edgeCounts[id] > 0
+
+    #rebuilds the CSR arrays from the flat edge arrays if edges changed since they were last built
+    def build(self):
+        if self.built:
+            return
+        self.deduplicate()
+        size = len(self.people)
+        labels = np.frombuffer(self.edgeLabels, dtype = np.int32)
+        lefts = np.frombuffer(self.edgeLefts, dtype = np.int32)
+        rights = np.frombuffer(self.edgeRights, dtype = np.int32)
+        self.forward = []
+        self.backward = []
+        for labelId in range(len(self.labelNames)):
+            mask = labels == labelId
+            self.forward.append(buildCSR(lefts[mask], rights[mask], size))
+            self.backward.append(buildCSR(rights[mask], lefts[mask], size))
+        self.built = True
+
+    #returns the GraphStatistics of the graph as it is now, see Graph.labelStatistics
+    def labelStatistics(self):
+        if self.statistics is not None and self.statistics.version == self.version:
+            return self.statistics
+        self.build()
+        labels = {}
+        for labelId, label in enumerate(self.labelNames):
+            if self.labelCounts[labelId] == 0:
+                continue
+            outDegrees = np.diff(self.forward[labelId][0])
+            inDegrees = np.diff(self.backward[labelId][0])
+            labels[label] = LabelStatistics(label, self.labelCounts[labelId],
+                                            int(np.count_nonzero(outDegrees)), int(outDegrees.max()),
+                                            int(np.count_nonzero(inDegrees)), int(inDegrees.max()))
+        self.statistics = GraphStatistics(labels, self.version, self.labelsVersion)
+        return self.statistics
+
+    #returns the (indptr, indices) arrays followed by edgeType, or None if its label is not in the graph
+    def csr(self, edgeType):
+        self.build()
+        label, direction = parseEdgeType(edgeType)
+        labelId = self.labels.get(label)
+        if labelId is None:
+            return None
+        if direction == OUTGOING:
+            return self.forward[labelId]
+        return self.backward[labelId]
+
+    #returns the sorted array of distinct ids reachable from the ids in frontier by following edgeType once
+    def expandIds(self, frontier, edgeType):
+        arrays = self.csr(edgeType)
+        if arrays is None or len(frontier) == 0:
+            return np.empty(0, dtype = np.int32)
+        indptr, indices = arrays
+        starts = indptr[frontier]
+        lengths = indptr[frontier + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype = np.int32)
+        #position of every neighbor in indices, segment by segment
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        return np.unique(indices[offsets])
+
+    #returns the number of edges of type edgeType that can be followed from the ids in frontier
+    def degreeIds(self, frontier, edgeType):
+        arrays = self.csr(edgeType)
+        if arrays is None or len(frontier) == 0:
+            return 0
+        indptr = arrays[0]
+        return int((indptr[frontier + 1] - indptr[frontier]).sum())
+
+    #returns the nodes reachable from node by following a single edge of type edgeType
+    def neighbors(self, node, edgeType):
+        if not self.hasNode(node):
+            return []
+        return [self.people[id] for id in self.expandIds(np.array([self.ids[node.name]]), edgeType)]
+
+    #returns the number of edges of type edgeType that can be followed from node
+    def degree(self, node, edgeType):
+        if not self.hasNode(node):
+            return 0
+        return self.degreeIds(np.array([self.ids[node.name]]), edgeType)
+
+    #returns the set of nodes reachable from any node in frontier by following a single edge of type edgeType
+    #stats = optional instrument.QueryStats counting the work done, depth = hops walked including this one
+    def expand(self, frontier, edgeType, stats = None, depth = 0):
+        ids = np.array([self.ids[node.name] for node in frontier if self.hasNode(node)], dtype = np.int64)
+        if stats is not None:
+            stats.expanded(edgeType, len(ids), self.degreeIds(ids, edgeType), depth)
+        return {self.people[id] for id in self.expandIds(ids, edgeType)}
+
+    #frontiers of the compiled plans (see Graph.frontierOf) are sorted arrays of distinct ids, as
+    #returned by expandIds, so a whole trie is walked without making any Node objects
+    def frontierOf(self, node):
+        if not self.hasNode(node):
+            return np.empty(0, dtype = np.int64)
+        return np.array([self.ids[node.name]], dtype = np.int64)
+
+    def expandFrontier(self, frontier, edgeType, stats = None, depth = 0):
+        if stats is not None:
+            stats.expanded(edgeType, len(frontier), self.degreeIds(frontier, edgeType), depth)
+        return self.expandIds(frontier, edgeType)
+
+    def inFrontier(self, frontier, node):
+        id = self.ids.get(node.name)
+        if id is None:
+            return False
+        i = np.searchsorted(frontier, id)
+        return bool(i < len(frontier) and frontier[i] == id)
+
+    def frontierNames(self, frontier):
+        return {self.people[id].name for id in frontier.tolist()}
+
+    #tests whether source is connected with destination using sequence of relationships in edgeTypes
+    #every hop expands the whole frontier at once, so this is the same search as hasRelationshipFrontier
+    #stats = optional instrument.QueryStats counting the work done
+    def hasRelationship(self, edgeTypes, source, destination, stats = None, depth = 1):
+        if type(source) is not Node or type(destination) is not Node:
+            raise TypeError("hasRelationship method in class CSRGraph must be passed Node objects for source and destination")
+
+        if not self.hasNode(source) or not self.hasNode(destination):
+            return False
+
+        frontier = np.array([self.ids[source.name]])
+        for edgeType in edgeTypes:
+            if stats is not None:
+                stats.expanded(edgeType, len(frontier), self.degreeIds(frontier, edgeType), depth)
+                depth += 1
+            frontier = self.expandIds(frontier, edgeType)
+            if len(frontier) == 0:
+                return False
+        return bool(np.any(frontier == self.ids[destination.name]))
+
+    def hasRelationshipFrontier(self, edgeTypes, source, destination, stats = None):
+        return self.hasRelationship(edgeTypes, source, destination, stats)
+
+    #same answer as hasRelationship, searching from both ends of the path at once
+    #see Graph.hasRelationshipBidirectional
+    def hasRelationshipBidirectional(self, edgeTypes, source, destination, stats = None):
+        if type(source) is not Node or type(destination) is not Node:
+            raise TypeError("hasRelationshipBidirectional method in class CSRGraph must be passed Node objects for source and destination")
+
+        if not self.hasNode(source) or not self.hasNode(destination):
+            return False
+
+        forward = np.array([self.ids[source.name]])
+        backward = np.array([self.ids[destination.name]])
+        first = 0
+        last = len(edgeTypes)
+        while first < last:
+            backwardEdgeType = reverseEdgeType(edgeTypes[last - 1])
+            forwardCost = self.degreeIds(forward, edgeTypes[first])
+            backwardCost = self.degreeIds(backward, backwardEdgeType)
+            if forwardCost <= backwardCost:
+                if stats is not None:
+                    stats.expanded(edgeTypes[first], len(forward), forwardCost, first + 1)
+                forward = self.expandIds(forward, edgeTypes[first])
+                first += 1
+            else:
+                if stats is not None:
+                    stats.expanded(backwardEdgeType, len(backward), backwardCost, len(edgeTypes) - last + 1)
+                backward = self.expandIds(backward, backwardEdgeType)
+                last -= 1
+
+            if len(forward) == 0 or len(backward) == 0:
+                return False
+
+        return bool(np.intersect1d(forward, backward, assume_unique = True).size)
+
+    #prints the status of the graph
+    def printGraph(self):
+        self.build()
+        for id in range(len(self.people)):
+            if self.edgeCounts[id] == 0:
+                continue
+            print("{}|\t".format(self.people[id].name), end = "")
+            for labelId in range(len(self.labelNames)):
+                indptr, indices = self.forward[labelId]
+                for right in indices[indptr[id]:indptr[id + 1]]:
+                    print("({}, {}, {})".format(self.labelNames[labelId], self.people[id].name, self.people[right].name), end = "")
+            print("\n")
+
+#returns the (indptr, indices) CSR arrays of the edges sources[i] -> targets[i] over size people
+def buildCSR(sources, targets, size):
+    order = np.argsort(sources, kind = "stable")
+    indptr = np.zeros(size + 1, dtype = np.int64)
+    np.cumsum(np.bincount(sources, minlength = size), out = indptr[1:])
+    return indptr, targets[order]
@@ -1,21 +1,93 @@
-import re, json, sys, time
-from statements import RelationshipStatement, DelegationStatement, Policy, Delegation
-from graph import Node, Edge, Graph
+import re, json, sys, time, argparse, asyncio, weakref
+from statements import RelationshipStatement, DelegationStatement, Policy, Delegation, internStatement, internDelegationStatement
+from graph import Node, Graph
+from plan import PolicyPlan
+from reverse import ResourceIndex
+from snapshot import hashFile, writeSnapshot, loadSnapshot
+
+#relationship statements with more labels than this are evaluated from both ends at once
+#when relatedVia is left to pick its own search method
+bidirectionalThreshold = 3
+
+#groups of more accessors than this are answered by collecting everyone granted access at once,
+#see batchHasAccess
+sharedEvaluationThreshold = 64
+
+#matches a whole relationship statement in one pass, capturing
+#   ! for negation, the run of <label>s, the a or d it ends with, T, and the permissions
+# e.g. !<friend><-parent>a(rw) => ("!", "<friend><-parent>", "a", None, "rw")
+STATEMENT_PATTERN = re.compile(r"^(?:(!?)((?:<-?\w+>)*)([ad])|(T))(?:\((\w+)\))?$")
+LABEL_PATTERN = re.compile(r"<(-?\w+)>")
+PERMISSIONS_PATTERN = re.compile(r"\(\w+\)")
+
+#parsed relationship statements by (statement string, isPartOfDelegationStatement), held only as long
+#as some policy still uses them
+parsedStatements = weakref.WeakValueDictionary()
 
 def main():
     #validate args
-    if len(sys.argv) != 2:
+    if len(sys.argv) < 2:
         print("Must provide policy file")
         sys.exit(0)
 
+    parser = argparse.ArgumentParser(description = "Answer access queries against a policy file")
+    parser.add_argument("policyFile")
+    parser.add_argument("--serve", action = "store_true", help = "run a decision server instead of the interactive query loop")
+    parser.add_argument("--host", default = "127.0.0.1", help = "address the decision server listens on")
+    parser.add_argument("--port", type = int, default = 8765, help = "port the decision server listens on")
+    parser.add_argument("--unix", help = "unix socket path the decision server listens on, instead of host and port")
+    parser.add_argument("--workers", type = int, default = 0, help = "worker processes validating delegations and evaluating server or batch queries, 0 to do it in this process")
+    parser.add_argument("--snapshot", help = "binary snapshot of the preprocessed policy file, see preprocess")
+    parser.add_argument("--engine", choices = ["dict", "csr", "partitioned"], default = "dict", help = "graph implementation holding the social network, see buildSocialNetwork")
+    parser.add_argument("--stream", action = "store_true", help = "stream the relationships of the policy file into the social network as they are read, see stream.py")
+    parser.add_argument("--edge-file", help = "edge list file holding the relationships, one <label>\\t<left>\\t<right> per line, implies --stream")
+    parser.add_argument("--batch", help = "answer the queries in this file (- for stdin) instead of the interactive query loop")
+    parser.add_argument("--format", choices = ["csv", "jsonl"], help = "format of the batch queries, by default guessed from the file extension")
+    parser.add_argument("--chunk-size", type = int, default = 10000, help = "number of batch queries answered together")
+    parser.add_argument("--materialize", action = "store_true", help = "answer interactive queries from a materialized index of the policies' relationship paths, see paths.py")
+    args = parser.parse_args()
+
     #preprocess the policy file
-    permissions, socialNetwork, nodes, resources = preprocess(sys.argv[1])
+    progress = None
+    if args.stream or args.edge_file is not None:
+        from stream import Progress
+        progress = Progress()
+    permissions, socialNetwork, nodes, resources = preprocess(args.policyFile, args.engine, args.snapshot, args.stream,
+                                                             args.edge_file, progress, args.workers or None)
+
+    if args.batch is not None:
+        from batch import runBatch, guessFormat
+        format = args.format if args.format is not None else guessFormat(args.batch)
+        if args.batch == "-":
+            runBatch(sys.stdin, sys.stdout, format, permissions, socialNetwork, nodes, resources, args.chunk_size, args.workers)
+        else:
+            with open(args.batch, "r", newline = "") as input:
+                runBatch(input, sys.stdout, format, permissions, socialNetwork, nodes, resources, args.chunk_size, args.workers)
+        return
+
+    if args.serve:
+        from server import DecisionServer
+        server = DecisionServer(permissions, socialNetwork, nodes, resources, args.workers, (args.policyFile, args.snapshot, args.edge_file))
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+        return
+
+    paths = None
+    if args.materialize:
+        from paths import buildPathIndex
+        paths = buildPathIndex(resources, socialNetwork, nodes)
 
     #begin query loop
-    queryLoop(permissions, socialNetwork, nodes, resources)
+    queryLoop(permissions, socialNetwork, nodes, resources, paths)
+
+# Returns the dict mapping each permission's name to its character, the reverse of permissions
+# e.g. {"r": "read"} => {"read": "r"}
+def permissionCharacters(permissions):
+    return {permissions[c]: c for c in permissions}
 
 # Main query loop
-def queryLoop(permissions, socialNetwork, nodes, resources):
+# paths = optional paths.PathIndex to answer queries with, see hasAccess
+def queryLoop(permissions, socialNetwork, nodes, resources, paths = None):
+    permissionChars = permissionCharacters(permissions)
     print("Please enter the resource you want to access, the name of the accessor, and the desired permission.\n")
     while(True):
         print("Resource: ", end = "")
@@ -27,21 +99,57 @@ def queryLoop(permissions, socialNetwork, nodes, resources):
         accessor = input().strip()
         print("Permission: ", end = "")
         perm = input().strip()
-        if perm not in permissions.values():
+        if perm not in permissionChars:
             print("{} is not an existing permission\n".format(perm))
             continue
-        perm = list(permissions.keys())[list(permissions.values()).index(perm)]
-        ret = (hasAccess(obj, accessor, perm, socialNetwork, resources, nodes))
+        perm = permissionChars[perm]
+        ret = (hasAccess(obj, accessor, perm, socialNetwork, resources, nodes, paths = paths))
         if(ret):
             print("Access Granted\n")
         else:
             print("Access Denied\n")
 
 #preprocesses the given policy file
-def preprocess(filename):
+#engine selects the graph implementation used for the social network, see buildSocialNetwork
+#snapshot = optional path of a binary snapshot of the preprocessed state. if the snapshot was made
+#from the current contents of the policy file (and edgeFile) it is loaded instead, otherwise the
+#policy file is preprocessed and the snapshot is (re)written
+#stream = whether to stream the relationships in the policy file into the social network as they
+#are read rather than loading the whole file first, see stream.py
+#edgeFile = optional edge list file holding the relationships, one <label>\t<left>\t<right> per line.
+#implies stream
+#progress = optional stream.Progress reporting the rate relationships are loaded at while streaming
+#workers, executor = how delegations are validated, see processDelegations
+#optimize = whether compiled policies are ordered and pruned by the social network's degree
+#statistics, see optimizePlans
+def preprocess(filename, engine = "dict", snapshot = None, stream = False, edgeFile = None, progress = None, workers = None, executor = "process", optimize = True):
+        if snapshot is not None:
+            if edgeFile is None:
+                sourceHash = hashFile(filename)
+            else:
+                sourceHash = hashFile(filename, edgeFile)
+            graph = newGraph(engine)
+            loaded = loadSnapshot(snapshot, sourceHash, graph)
+            if loaded is not None:
+                if optimize:
+                    optimizePlans(loaded[3], loaded[1])
+                return loaded
+            #the snapshot is stale, its graph is not used
+            if hasattr(graph, "close"):
+                graph.close()
+            permissions, socialNetwork, nodes, resources = preprocess(filename, engine, None, stream, edgeFile, progress, workers, executor, optimize)
+            writeSnapshot(snapshot, sourceHash, permissions, socialNetwork, nodes, resources)
+            return permissions, socialNetwork, nodes, resources
+
         try:
-            policyFile = open(filename, "r")
-            fileDict = json.load(policyFile)
+            if stream or edgeFile is not None:
+                from stream import streamPolicyFile
+                socialNetwork = newGraph(engine)
+                nodes = {}
+                fileDict = streamPolicyFile(filename, socialNetwork, nodes, edgeFile, progress)
+            else:
+                policyFile = open(filename, "r")
+                fileDict = json.load(policyFile)
 
         except ValueError as e:
             print("Error decoding policy file: ")
@@ -52,73 +160,102 @@ def preprocess(filename):
         permissions = fileDict["permission types"]
 
         #process relationships
-        socialNetwork, nodes = buildSocialNetwork(fileDict["relationships"])
+        if not (stream or edgeFile is not None):
+            socialNetwork, nodes = buildSocialNetwork(fileDict["relationships"], engine)
 
         #process policies, replace with policy objects
         resources = fileDict["resources"]
+        templates = {}
         for key in resources:
             resource = resources[key]
             policy = resource["policy"]
-            resource["policy"] = processPolicy(policy)
+            resource["policy"] = processPolicy(policy, templates)
+        if optimize:
+            optimizePlans(resources, socialNetwork)
 
         #process delegations. valid delegations turned into Delegation objects and
         #appended to the policy object for the given resource
-        processDelegations(resources, socialNetwork, nodes, permissions)
+        processDelegations(resources, socialNetwork, nodes, permissions, workers, executor)
         return permissions, socialNetwork, nodes, resources
 
+# Optimizes the compiled plan of every resource's policy against the degree statistics of
+# socialNetwork, so cheap statements are tried first and statements using labels with no edges
+# are pruned (see PolicyPlan.optimize). Plans stay optimized as delegations are added, and are
+# optimized again when a pruned label may have appeared in socialNetwork
+def optimizePlans(resources, socialNetwork):
+    statistics = socialNetwork.labelStatistics()
+    for resource in resources.values():
+        plan = resource["policy"].plan
+        if plan is not None and plan.statistics is not statistics:
+            plan.optimize(statistics)
+
 # Processes the delegations for each resource. If a delegation is valid, it is turned into
 # a Delegation object and appended to the policy object of the resource in question
 # A delegation is valid iff
 #   -there there is a delegation statement in the policy that allows a delegator to delegate
 #   -the delegator is delegating permissions that they actually have
-def processDelegations(resources, socialNetwork, nodes, permissions):
+# workers = optional number of workers to validate resources across, see parallel.py
+# executor = whether those workers are "process"es or "thread"s
+def processDelegations(resources, socialNetwork, nodes, permissions, workers = None, executor = "process"):
+    if workers is not None and workers > 1:
+        from parallel import processDelegationsParallel
+        processDelegationsParallel(resources, socialNetwork, nodes, permissions, workers, executor)
+        return
+
     for resource in resources:
         #if delegations exist for this resource, process them. otherwise skip this resource
         if "delegations" not in resources[resource]:
             continue
 
         delegations = resources[resource]["delegations"]
-        owner = resources[resource]["owner"]
         policy = resources[resource]["policy"]
 
         for delegator in delegations:
-            #check all delegation statements in this policy, see if any connect owner to delegator,
-            #allowing delegator to delegate
-            for statement in policy.statements:
-                if type(statement) is DelegationStatement:
-                    relationshipStatement = statement.relationship
-                    ret = relatedVia(relationshipStatement, owner, delegator, socialNetwork, nodes)
-
-                    #if accessor isnt related to owner via this relationship statement, move on to
-                    #next delegation statement in resource's policy
-                    if not ret:
-                        continue
-
-                    #make sure delegator actually has the permissions they are trying to delegate
-                    perms = re.findall("\(\w+\)", delegations[delegator]["delegates"])[0]
-                    perms = perms[1:len(perms)-1]
-                    for c in perms:
-                        #make sure permission exists in permission dict
-                        if c not in permissions:
-                            errorString = "Nonexistent permission used in delegation statement: " + c
-                            raise SyntaxError(errorString)
-
-                        #make sure delegator has this permission
-                        if not hasAccess(resource, delegator, c, socialNetwork, resources, nodes):
-                            errorString = "Permissions cannot be delegated by individuals without permissions in question\n"
-                            errorString = errorString + "{} attempted to delegate {} permission for resource {}".format(delegator, c, resource)
-                            raise SyntaxError(errorString)
-
-                    #ok to delegate, create new relationship statement and append to policy
-                    #add permissions as part of relationship string. dumb fix
-                    delegates = delegations[delegator]["delegates"]
-                    delegation = Delegation(parseRelationshipStatement(delegates, False), delegator)
-                    policy.statements.append(delegation)
-                    break
-
-            #if no Delegation statements allow delegator to delegate raise Error
-            else:
-                raise SyntaxError("Invalid attempt to delegate: {} attempted to delegate for resource {}".format(delegator, resource))
+            delegation = validateDelegation(resource, delegator, resources, socialNetwork, nodes, permissions)
+            policy.addDelegation(delegation)
+
+# Checks the delegation made by delegator for resource against the resource's policy as it stands,
+# including delegations already added to it. Returns the corresponding Delegation object if valid,
+# raises SyntaxError otherwise
+def validateDelegation(resource, delegator, resources, socialNetwork, nodes, permissions):
+    delegations = resources[resource]["delegations"]
+    owner = resources[resource]["owner"]
+    policy = resources[resource]["policy"]
+
+    #check all delegation statements in this policy, see if any connect owner to delegator,
+    #allowing delegator to delegate
+    for statement in policy.statements:
+        if type(statement) is DelegationStatement:
+            relationshipStatement = statement.relationship
+            ret = relatedVia(relationshipStatement, owner, delegator, socialNetwork, nodes)
+
+            #if accessor isnt related to owner via this relationship statement, move on to
+            #next delegation statement in resource's policy
+            if not ret:
+                continue
+
+            #make sure delegator actually has the permissions they are trying to delegate
+            perms = PERMISSIONS_PATTERN.findall(delegations[delegator]["delegates"])[0]
+            perms = perms[1:len(perms)-1]
+            for c in perms:
+                #make sure permission exists in permission dict
+                if c not in permissions:
+                    errorString = "Nonexistent permission used in delegation statement: " + c
+                    raise SyntaxError(errorString)
+
+                #make sure delegator has this permission
+                if not hasAccess(resource, delegator, c, socialNetwork, resources, nodes):
+                    errorString = "Permissions cannot be delegated by individuals without permissions in question\n"
+                    errorString = errorString + "{} attempted to delegate {} permission for resource {}".format(delegator, c, resource)
+                    raise SyntaxError(errorString)
+
+            #ok to delegate, create new relationship statement
+            #add permissions as part of relationship string. dumb fix
+            delegates = delegations[delegator]["delegates"]
+            return Delegation(parseRelationshipStatement(delegates, False), delegator)
+
+    #if no Delegation statements allow delegator to delegate raise Error
+    raise SyntaxError("Invalid attempt to delegate: {} attempted to delegate for resource {}".format(delegator, resource))
 
 
 # Answers the question "does accessor have access to resource with permission"
@@ -127,10 +264,45 @@ def processDelegations(resources, socialNetwork, nodes, permissions):
 # resources is the dict of resources after replacing policy strings with policy objects during preprocessing
 # nodes is a the dict mapping string representations of individuals to corresponding Node objects
 # permission must be given as a character
-def hasAccess(resource, accessor, permission, socialNetwork, resources, nodes):
+# compiled = whether to answer with the policy's compiled plan (when it has one) instead of
+# evaluating each statement on its own
+# cache = optional AccessCache. decisions are reused until the social network, the resource's
+# policy or the resource's owner changes, and relationship paths until the social network changes
+# profiler = optional instrument.Profiler, given the QueryStats of the query once it is answered
+# paths = optional paths.PathIndex answering relationship paths with a set lookup
+def hasAccess(resource, accessor, permission, socialNetwork, resources, nodes, compiled = True, cache = None, profiler = None, paths = None):
     owner = resources[resource]["owner"]
     policy = resources[resource]["policy"]
 
+    stats = None
+    if profiler is not None:
+        stats = profiler.start(resource, accessor, permission)
+        start = time.perf_counter()
+
+    if cache is None:
+        decision = evaluatePolicy(policy, owner, accessor, permission, socialNetwork, nodes, compiled, stats = stats, paths = paths)
+    else:
+        key = (resource, accessor, permission)
+        version = (socialNetwork.version, policy.version, owner)
+        found, decision = cache.decisions.get(key, version)
+        if not found:
+            decision = evaluatePolicy(policy, owner, accessor, permission, socialNetwork, nodes, compiled, cache, stats, paths)
+            cache.decisions.put(key, version, decision)
+        elif stats is not None:
+            stats.cacheHit = True
+
+    if stats is not None:
+        stats.seconds = time.perf_counter() - start
+        profiler.record(stats)
+    return decision
+
+# Answers whether policy, belonging to a resource owned by owner, grants permission to accessor
+# see hasAccess for the meaning of the remaining arguments
+# stats = optional instrument.QueryStats counting the work done
+def evaluatePolicy(policy, owner, accessor, permission, socialNetwork, nodes, compiled = True, cache = None, stats = None, paths = None):
+    if compiled and policy.plan is not None:
+        return policy.plan.hasAccess(permission, owner, accessor, socialNetwork, nodes, stats, paths, cache)
+
     for statement in policy.statements:
         #actual delegation statements not used to determine access
         #delegations themselves cross referenced with Delegation Statements and
@@ -141,27 +313,114 @@ def hasAccess(resource, accessor, permission, socialNetwork, resources, nodes):
         if type(statement) is RelationshipStatement:
             #check whether this statement can even grant the wanted permission
             if statement.permissions.find(permission) == -1:
+                if stats is not None:
+                    stats.statementsSkipped += 1
                 continue
 
             #check whether this relationship connects owner to accessor
-            related = relatedVia(statement, owner, accessor, socialNetwork, nodes)
+            relationship = statement
+            anchor = owner
             
 
         if type(statement) is Delegation:
             #check whether this statement can even grant the wanted permission
             if statement.relationship.permissions.find(permission) == -1:
+                if stats is not None:
+                    stats.statementsSkipped += 1
                 continue
 
             #check whether this relationship connects delegator to accessor
-            delegator = statement.delegator
-            related = relatedVia(statement.relationship, delegator, accessor, socialNetwork, nodes)
-
-        if related :
-             return True
+            relationship = statement.relationship
+            anchor = statement.delegator
+
+        if stats is not None:
+            stats.statementsEvaluated += 1
+        if relatedVia(relationship, anchor, accessor, socialNetwork, nodes, cache = cache, stats = stats, paths = paths):
+            if stats is not None:
+                stats.granted(relationship, anchor)
+            return True
     return False
 
+# Answers the question "who has access to resource with permission"
+# returns the set of names, out of the people in the social network (nodes), granted permission
+# every statement of the resource's policy is evaluated once for everyone, rather than once per accessor
+# this is the only place the people granted access by negated statements are listed one by one
+def whoHasAccess(resource, permission, socialNetwork, resources, nodes):
+    granted = grantedTo(resource, permission, socialNetwork, resources, nodes)
+    return {name for name in nodes if name in granted}
+
+# Answers hasAccess for every accessor in accessors at once
+# returns a dict mapping each accessor to whether they have permission for resource
+# up to sharedEvaluationThreshold accessors are checked together during one walk of the policy's plan,
+# which stops as soon as all of them are granted access. for more accessors than that, everyone
+# granted access is collected once with grantedTo and each accessor is checked against it
+def batchHasAccess(resource, accessors, permission, socialNetwork, resources, nodes):
+    if len(accessors) > sharedEvaluationThreshold:
+        granted = grantedTo(resource, permission, socialNetwork, resources, nodes)
+        return {accessor: accessor in granted for accessor in accessors}
+
+    owner = resources[resource]["owner"]
+    policy = resources[resource]["policy"]
+    plan = policy.plan
+    if plan is None:
+        plan = PolicyPlan(policy.statements)
+    return plan.hasAccessAll(permission, owner, accessors, socialNetwork, nodes)
+
+# Answers the question "which resources can accessor access"
+# returns a dict mapping each resource accessor can access to the permission characters they are granted
+# index = optional ResourceIndex built from resources, rebuilt here if resources have changed since
+def accessibleResources(accessor, socialNetwork, resources, nodes, index = None):
+    if index is None or not index.isCurrent(resources):
+        index = ResourceIndex(resources)
+    return index.accessibleResources(accessor, socialNetwork, nodes)
+
+# Answers a list of (accessor, permission) queries against resource, returns the list of answers
+def decideQueries(resource, queries, socialNetwork, resources, nodes):
+    return decideBatch([(resource, accessor, permission) for accessor, permission in queries], socialNetwork, resources, nodes)
+
+# Answers a list of (resource, accessor, permission) queries, returns the list of answers
+# queries are grouped by the policy plan, owner and permission they are evaluated with, so every
+# group shares one evaluation of the policy (see batchHasAccess). resources parsed from the same
+# policy string with the same owner fall in the same group. a group of a single query is answered
+# with hasAccess instead
+def decideBatch(queries, socialNetwork, resources, nodes):
+    groups = {}
+    for query in queries:
+        resource, accessor, permission = query
+        policy = resources[resource]["policy"]
+        key = (id(policy.plan) if policy.plan is not None else resource, resources[resource]["owner"], permission)
+        groups.setdefault(key, []).append(query)
+
+    decisions = {}
+    for group in groups.values():
+        resource, accessor, permission = group[0]
+        if len(group) == 1:
+            decisions[group[0]] = hasAccess(resource, accessor, permission, socialNetwork, resources, nodes)
+            continue
+        granted = batchHasAccess(resource, [query[1] for query in group], permission, socialNetwork, resources, nodes)
+        for query in group:
+            decisions[query] = granted[query[1]]
+    return [decisions[query] for query in queries]
+
+# Returns the AccessSet of everyone granted permission for resource
+def grantedTo(resource, permission, socialNetwork, resources, nodes):
+    owner = resources[resource]["owner"]
+    policy = resources[resource]["policy"]
+    plan = policy.plan
+    if plan is None:
+        plan = PolicyPlan(policy.statements)
+    return plan.grantedTo(permission, owner, socialNetwork, nodes)
+
 # Determines whether owner is related to accessor via relationshipStatement
-def relatedVia(statement, owner, accessor, socialNetwork, nodes):
+# search selects how the relationship path is evaluated:
+#   "recursive" follows one path at a time, depth first
+#   "frontier" moves a deduplicated set of nodes forward one hop at a time
+#   "bidirectional" expands from both owner and accessor until the two sides meet
+#   "auto" uses bidirectional for paths longer than bidirectionalThreshold, recursive otherwise
+# cache = optional AccessCache, relationship paths are reused until the social network changes
+# stats = optional instrument.QueryStats counting the work done
+# paths = optional paths.PathIndex, the relationship path is only walked if it is not materialized there
+def relatedVia(statement, owner, accessor, socialNetwork, nodes, search = "auto", cache = None, stats = None, paths = None):
     #check special cases for relationship statement
     if statement.everyone:
         return True #T
@@ -181,7 +440,35 @@ def relatedVia(statement, owner, accessor, socialNetwork, nodes):
         return False
     ownerNode = nodes[owner]
     accessorNode = nodes[accessor]
-    ret = socialNetwork.hasRelationship(statement.labels, ownerNode, accessorNode)
+
+    if paths is not None:
+        found, reached = paths.lookup(owner, statement.labels)
+        if found:
+            return (accessor in reached) != statement.negation
+
+    if cache is not None:
+        key = (tuple(statement.labels), owner, accessor)
+        found, ret = cache.relationships.get(key, socialNetwork.version)
+        if found:
+            return ret != statement.negation
+
+    if search == "auto":
+        if len(statement.labels) > bidirectionalThreshold:
+            search = "bidirectional"
+        else:
+            search = "recursive"
+
+    if search == "recursive":
+        ret = socialNetwork.hasRelationship(statement.labels, ownerNode, accessorNode, stats)
+    elif search == "frontier":
+        ret = socialNetwork.hasRelationshipFrontier(statement.labels, ownerNode, accessorNode, stats)
+    elif search == "bidirectional":
+        ret = socialNetwork.hasRelationshipBidirectional(statement.labels, ownerNode, accessorNode, stats)
+    else:
+        raise ValueError("Unknown search method for relatedVia: {}".format(search))
+
+    if cache is not None:
+        cache.relationships.put(key, socialNetwork.version, ret)
 
     if statement.negation:
         ret = not ret
@@ -189,10 +476,14 @@ def relatedVia(statement, owner, accessor, socialNetwork, nodes):
     return ret
 
 # Turns the relationship dictionary from the policy file into a social network graph
-def buildSocialNetwork(relationships):
+# engine selects the graph implementation:
+#   "dict" builds a Graph, mapping nodes to their edges
+#   "csr" builds a CSRGraph, integer ids and per label CSR arrays (requires numpy)
+#   "partitioned" builds a PartitionedGraph, sharded across worker processes (see partition.py)
+def buildSocialNetwork(relationships, engine = "dict"):
     if type(relationships) is not dict:
         raise TypeError("Relationships in policy file must take the form of a dictionary")
-    socialNetwork = Graph()
+    socialNetwork = newGraph(engine)
     nodes = {}                  #all people seen so far, maps string name to their node
                                 #to avoid duplicate Nodes
 
@@ -203,37 +494,75 @@ def buildSocialNetwork(relationships):
             raise SyntaxError("Relationships in policy file improperly formatted")
 
         for relationship in relationshipArr:
-            if type(relationship) is not str:
-                raise SyntaxError("Relationships in policy file improperly formatted")
-
-            individuals = relationship.split(",")
-            if len(individuals) != 2:
-                raise(SyntaxError("Relationships in policy file improperly formatted"))
-            #remove leading and trailing whitespace around names
-            individuals[0] = individuals[0].strip()
-            individuals[1] = individuals[1].strip()
-
-            #check if a node has been made for each person in this relationship
-            #if not, make a new one
-            if individuals[0] in nodes:
-                left = nodes[individuals[0]]
-            else:
-                left = Node(individuals[0])
-                nodes[individuals[0]] = left
+            addRelationshipString(socialNetwork, nodes, key, relationship)
 
-            if individuals[1] in nodes:
-                right = nodes[individuals[1]]
-            else:
-                right = Node(individuals[1])
-                nodes[individuals[1]] = right
+    return socialNetwork, nodes
 
-            socialNetwork.addEdge(key, left, right)
+# Returns an empty social network graph for the given engine, see buildSocialNetwork
+def newGraph(engine):
+    if engine == "dict":
+        return Graph()
+    if engine == "csr":
+        from csrgraph import CSRGraph
+        return CSRGraph()
+    if engine == "partitioned":
+        from partition import PartitionedGraph
+        return PartitionedGraph()
+    raise ValueError("Unknown graph engine: {}".format(engine))
+
+# Adds the edge described by a relationship string from the policy file, e.g. "Marie, Olivia"
+# listed under label
+def addRelationshipString(socialNetwork, nodes, label, relationship):
+    if type(relationship) is not str:
+        raise SyntaxError("Relationships in policy file improperly formatted")
+
+    individuals = relationship.split(",")
+    if len(individuals) != 2:
+        raise(SyntaxError("Relationships in policy file improperly formatted"))
+    #remove leading and trailing whitespace around names
+    addRelationship(socialNetwork, nodes, label, individuals[0].strip(), individuals[1].strip())
+
+# Adds an edge indicating that the person named left has relationship label with the person named right
+def addRelationship(socialNetwork, nodes, label, left, right):
+    #check if a node has been made for each person in this relationship
+    #if not, make a new one
+    if left in nodes:
+        leftNode = nodes[left]
+    else:
+        leftNode = Node(left)
+        nodes[left] = leftNode
 
-    return socialNetwork, nodes
+    if right in nodes:
+        rightNode = nodes[right]
+    else:
+        rightNode = Node(right)
+        nodes[right] = rightNode
+
+    socialNetwork.addEdge(label, leftNode, rightNode)
 
-# Takes a string representation of a policy and returns a policy object to represent it
+# Takes a string representation of a policy and returns a policy object to represent it,
+# along with the plan it is compiled into for answering queries
 # Checks syntax along the way, raises errors if improper syntax
-def processPolicy(policy):
+# templates = optional dict mapping policy strings to the policies already made from them, for one
+# social network. each distinct policy string in it is only parsed once, later policies made from
+# the same string share its statements and plan until a delegation is added to them
+# plans are optimized against the social network they are used with, so templates must never be
+# shared between social networks
+def processPolicy(policy, templates = None):
+    if templates is None:
+        return compilePolicy(parsePolicy(policy))
+    template = templates.get(policy)
+    if template is None:
+        template = compilePolicy(parsePolicy(policy))
+        templates[policy] = template
+
+    newPolicy = Policy(template.statements)
+    newPolicy.plan = template.plan
+    newPolicy.shared = True
+    return newPolicy
+
+# Takes a string representation of a policy and returns the list of statement objects it is made of
+def parsePolicy(policy):
     #to hold to array of statement objects
     resultArray = []
 
@@ -249,64 +578,54 @@ def processPolicy(policy):
             resultArray.append(parseDelegationStatement(statement))
         else:
             resultArray.append(parseRelationshipStatement(statement, False))
-    newPolicy = Policy(resultArray)
+    return resultArray
+
+# Returns a Policy made of statements, with its compiled plan
+def compilePolicy(statements):
+    newPolicy = Policy(statements)
+    newPolicy.plan = PolicyPlan(newPolicy.statements)
     return newPolicy
 
 
 # Takes an individual relationship statement, parses it,
 # and returns a corresponding relationshipStatement object
+# Statements are validated and split into their parts with a single match of STATEMENT_PATTERN.
+# The returned objects are interned, and shared by every policy using the same statement
 def parseRelationshipStatement(statement, isPartOfDelegationStatement, delegator = None):
+    key = (statement, isPartOfDelegationStatement)
+    parsed = parsedStatements.get(key)
+    if parsed is not None:
+        return parsed
+
     syntaxErrorString = "Error in policy syntax. Relationship statement written incorrectly: " + statement
+    match = STATEMENT_PATTERN.match(statement)
+    if match is None:
+        raise SyntaxError(syntaxErrorString)
+    negation, labels, target, everyone, permissions = match.groups()
 
     #verify that statement takes the proper form
-    if isPartOfDelegationStatement and re.search("^(!?(<-?\w+>)*a|T)$", statement) is None:
-        raise SyntaxError(syntaxErrorString)
-    if (not isPartOfDelegationStatement) and re.search("^(!?(<-?\w+>)*(a|d)|T)(\(\w+\))$", statement) is None:
+    #statements inside a delegation statement end with a and have no permissions, others must have permissions
+    if isPartOfDelegationStatement:
+        if permissions is not None or target == "d" or statement.endswith("\n"):
+            raise SyntaxError(syntaxErrorString)
+    elif permissions is None:
         raise SyntaxError(syntaxErrorString)
 
-    #separate out permissions if applicable
-    firstParen = statement.find("(")
-    secondParen = statement.find(")")
-    if(firstParen != -1):
-        permissions = statement[firstParen + 1: secondParen]
-        statement = statement[:firstParen]
-    else:
-        permissions = None
-
     #special cases
-    if statement == "a":
-        return RelationshipStatement(owner = True, everyone = False, negation = False, permissions = permissions)
-
-    elif statement == "!a":
-        return RelationshipStatement(owner = True, everyone = False, negation = True, permissions = permissions)
-
-    elif statement == "T":
-        return RelationshipStatement(owner = False, everyone = True, negation = False, permissions = permissions)
-
-    #for longer statements
-    #process and remove ! at beginning, if applicable
-    if statement[0] == "!":
-        negation = True
-        statement = statement[1:]
+    if everyone is not None:
+        parsed = internStatement(owner = False, everyone = True, negation = False, permissions = permissions) #T
+    elif labels == "":
+        #a and !a, a statement needs at least one relationship to end with d
+        if target == "d":
+            raise SyntaxError(syntaxErrorString)
+        parsed = internStatement(owner = True, everyone = False, negation = negation == "!", permissions = permissions)
     else:
-        negation = False
-
-    #check that statement terminates with a, remove it
-    length = len(statement)
-    if statement[length -1] != "a" and statement[length-1] !="d" :
-        raise SyntaxError(syntaxErrorString)
-    else:
-        statement = statement [: length - 1]
-
-    #verify that remaining strings take the form <relationship><relationship>....
-    if re.search("^(<-?\w+>)+$", statement) is None:
-        raise SyntaxError(syntaxErrorString)
+        #turn the relationships into a list of relationship identifiers
+        #ex. <friend><parent><sibling> => ["friend", "parent", "sibling"]
+        parsed = internStatement(owner = False, everyone = False, negation = negation == "!", labels = LABEL_PATTERN.findall(labels), permissions = permissions)
 
-    #turn the remaining statement into a list of relationship identifiers
-    #ex. <friend><parent><sibling> => ["friend", "parent", "sibling"]
-    matches = re.findall("<-?\w+>", statement)
-    matches = [match[1:len(match) - 1] for match in matches]
-    return RelationshipStatement(owner = False, everyone = False, negation = negation, labels = matches, permissions = permissions)
+    parsedStatements[key] = parsed
+    return parsed
 
 # Takes a string representation of a delegation statement, parses it,
 # returns a corresponding DelegationStatement object
@@ -315,26 +634,16 @@ def parseDelegationStatement(statement):
     syntaxErrorString = "Error in policy syntax. Delegation statement written incorrectly: " + statement
     #make sure delegation statement starts with $( and ends with )
     #remove these characters so we end up with a RelationshipStatement object
-    if statement[0] != "$":
-        raise SyntaxError(syntaxErrorString)
-    else:
-        statement = statement[1:]
-    if statement[0] != "(":
-        raise SyntaxError(syntaxErrorString)
-    else:
-        statement = statement[1:]
-    if statement[len(statement) - 1] != ")":
-        raise SyntaxError(syntaxErrorString)
-    else:
-        statement = statement[:len(statement) - 1]
-
-    #TODO: make sure there is no permissions argument!!
-    if re.search("^(!?(<-?\w+>)*a|T)$", statement) is None:
+    if not (statement.startswith("$(") and statement.endswith(")")):
         raise SyntaxError(syntaxErrorString)
+    statement = statement[2:len(statement) - 1]
 
     #what is left should be a relationship statement without permissions
-    relationshipStatement = parseRelationshipStatement(statement, True)
-    return DelegationStatement(relationshipStatement)
+    try:
+        relationshipStatement = parseRelationshipStatement(statement, True)
+    except SyntaxError:
+        raise SyntaxError(syntaxErrorString)
+    return internDelegationStatement(relationshipStatement)
 
 
 
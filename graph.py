@@ -1,87 +1,371 @@
-#represents a relationship between two people(nodes)
-#relationship goes from left to right (subject to object)
-#Ex. if the relationship is parent, left is the parent of right
-class Edge:
-  def __init__(self, id, node1, node2):
-    self.relationshipIdentifier = id
-    self.left = node1
-    self.right = node2
+import itertools, sys
 
 #represents a person
 class Node:
+  __slots__ = ("name",)
+
   def __init__(self, name):
     self.name = name
 
+#directions an edge can be followed in, relative to the node it is stored under
+#an edge type written -<label> follows edges outgoing from a node (node is the left of the edge)
+#an edge type written <label> follows edges incoming to a node (node is the right of the edge)
+OUTGOING = "out"
+INCOMING = "in"
+
+#every time a label appears in a graph that had no edges of that label, the graph draws a new number
+#from here as its labelsVersion. compiled plans pruned against the labels of one graph use it to tell
+#when they have to be optimized again, even across different graphs
+labelVersions = itertools.count()
+
+#splits an edge type from a relationship path into its label and the direction it is followed in
+# e.g. "-parent" => ("parent", OUTGOING), "parent" => ("parent", INCOMING)
+def parseEdgeType(edgeType):
+    if edgeType.find("-") != -1:
+        return edgeType[1:], OUTGOING
+    return edgeType, INCOMING
+
+#returns the edge type that walks the same edges as edgeType in the opposite direction
+# e.g. "parent" => "-parent", "-parent" => "parent"
+def reverseEdgeType(edgeType):
+    label, direction = parseEdgeType(edgeType)
+    if direction == OUTGOING:
+        return label
+    return "-" + label
+
+#degree statistics of the edges of one label, used to estimate the cost of following it
+#edges = number of edges, sources/targets = number of people with at least one outgoing/incoming edge
+#maxOut/maxIn = largest number of outgoing/incoming edges of any one person
+class LabelStatistics:
+    def __init__(self, label, edges, sources, maxOut, targets, maxIn):
+        self.label = label
+        self.edges = edges
+        self.avgOut = edges / sources if sources else 0.0
+        self.maxOut = maxOut
+        self.avgIn = edges / targets if targets else 0.0
+        self.maxIn = maxIn
+
+#degree statistics of every label of a graph, as returned by labelStatistics
+#labels maps every label with at least one edge to its LabelStatistics
+#version and labelsVersion are those of the graph when the statistics were collected
+class GraphStatistics:
+    def __init__(self, labels, version, labelsVersion):
+        self.labels = labels
+        self.version = version
+        self.labelsVersion = labelsVersion
+
+    #whether the graph had any edges of label
+    def hasLabel(self, label):
+        return label in self.labels
+
+    #returns the average number of edges of type edgeType followed from a person that has any
+    def fanOut(self, edgeType):
+        label, direction = parseEdgeType(edgeType)
+        statistics = self.labels.get(label)
+        if statistics is None:
+            return 0.0
+        if direction == OUTGOING:
+            return statistics.avgOut
+        return statistics.avgIn
+
 #represents a social network represented as a graph
-#graph is stored as a mapping of nodes to a list of edges
+#index maps each node to its neighbors, keyed by relationship label and then direction, as a pair of
+#lists (outgoing, incoming). use neighbors rather than reading it directly
+#   e.g. index[node]["parent"][1] holds the parents of node, neighbors(node, "parent")
+#every relationship is stored as node2 in node1's outgoing list and node1 in node2's incoming list,
+#so the edges of the graph are the outgoing lists (see edgeList). only nodes with at least one
+#relationship, and labels with at least one neighbor, have an entry
+#a relationship is only stored once, adding it again leaves the graph unchanged
+#version goes up every time the graph changes, so cached answers can tell when they are stale
+#labelCounts maps each label to its number of edges, labelsVersion changes whenever a label
+#without edges gets one (see labelVersions)
 class Graph:
     def __init__(self):
-        self.graph = {}
+        self.index = {}
+        self.version = 0
+        self.labelCounts = {}
+        self.labelsVersion = next(labelVersions)
+        self.statistics = None      #GraphStatistics last returned by labelStatistics
+        self.observers = []         #told about every edge added or removed, see addObserver
 
     #prints the status of the graph
     def printGraph(self):
-        for key in self.graph:
-            print("{}|\t".format(key.name), end = "")
-            for edge in self.graph[key]:
-                print("({}, {}, {})".format(edge.relationshipIdentifier, edge.left.name, edge.right.name), end = "")
+        for node, labels in self.index.items():
+            print("{}|\t".format(node.name), end = "")
+            for label, (outgoing, incoming) in labels.items():
+                for neighbor in outgoing:
+                    print("({}, {}, {})".format(label, node.name, neighbor.name), end = "")
+                for neighbor in incoming:
+                    #a relationship of a node with itself was printed with the outgoing ones
+                    if neighbor is not node:
+                        print("({}, {}, {})".format(label, neighbor.name, node.name), end = "")
             print("\n")
 
     #add a new edge to the graph
     #indicates that node1 is has relationship <relationshipIdentifier> with node2
     #and node2 has relationship -<relationshipIdentifier> with node1
+    #returns whether the edge was added, False if the graph already had it
     def addEdge(self, relationshipIdentifier, node1, node2):
-        #update node 1's edge list
-        if node1 in self.graph:
-            edges = self.graph[node1]
-        else:
-            edges = []
-        edges.append(Edge(relationshipIdentifier, node1, node2))
-        self.graph[node1] = edges
-
-        #update node2's edge list
-        if node2 in self.graph:
-            edges = self.graph[node2]
-        else:
-            edges = []
-        edges.append(Edge(relationshipIdentifier, node1, node2))
-        self.graph[node2] = edges
+        relationshipIdentifier = sys.intern(relationshipIdentifier)
+        outgoing = self.neighborLists(node1, relationshipIdentifier)[0]
+        incoming = self.neighborLists(node2, relationshipIdentifier)[1]
+        #the edge is already there, see hasEdge. the lists are only empty for a new edge
+        if len(outgoing) <= len(incoming):
+            if node2 in outgoing:
+                return False
+        elif node1 in incoming:
+            return False
+
+        #update the adjacency index in both directions
+        outgoing.append(node2)
+        incoming.append(node1)
+        self.countLabel(relationshipIdentifier, 1)
+        self.version += 1
+        for observer in self.observers:
+            observer.edgeAdded(relationshipIdentifier, node1, node2)
+        return True
+
+    #whether node1 has relationship <relationshipIdentifier> with node2
+    #scans whichever of node1's outgoing and node2's incoming neighbors is shorter
+    def hasEdge(self, relationshipIdentifier, node1, node2):
+        labels = self.index.get(node1)
+        if labels is None:
+            return False
+        pair = labels.get(relationshipIdentifier)
+        if pair is None:
+            return False
+        labels = self.index.get(node2)
+        if labels is None or relationshipIdentifier not in labels:
+            return False
+        outgoing = pair[0]
+        incoming = labels[relationshipIdentifier][1]
+        if len(outgoing) <= len(incoming):
+            return node2 in outgoing
+        return node1 in incoming
+
+    #remove the edge indicating that node1 has relationship <relationshipIdentifier> with node2
+    #nodes left without any edges are removed from the graph
+    #returns whether such an edge existed
+    def removeEdge(self, relationshipIdentifier, node1, node2):
+        if not self.hasEdge(relationshipIdentifier, node1, node2):
+            return False
+
+        self.unindexNeighbor(node1, relationshipIdentifier, OUTGOING, node2)
+        self.unindexNeighbor(node2, relationshipIdentifier, INCOMING, node1)
+        self.countLabel(relationshipIdentifier, -1)
+        self.version += 1
+        for observer in self.observers:
+            observer.edgeRemoved(relationshipIdentifier, node1, node2)
+        return True
+
+    #registers observer to have observer.edgeAdded(label, node1, node2) and observer.edgeRemoved(...)
+    #called after every edge added to or removed from the graph
+    def addObserver(self, observer):
+        self.observers.append(observer)
+
+    def removeObserver(self, observer):
+        self.observers.remove(observer)
+
+    #adds change to the number of edges of label
+    def countLabel(self, label, change):
+        count = self.labelCounts.get(label, 0)
+        if count == 0 and change > 0:
+            self.labelsVersion = next(labelVersions)
+        self.labelCounts[label] = count + change
+
+    #returns the GraphStatistics of the graph as it is now
+    def labelStatistics(self):
+        if self.statistics is not None and self.statistics.version == self.version:
+            return self.statistics
+        #per label [edges, sources, maxOut, targets, maxIn]
+        counts = {}
+        for labels in self.index.values():
+            for label, (outgoing, incoming) in labels.items():
+                outDegree = len(outgoing)
+                inDegree = len(incoming)
+                if label not in counts:
+                    counts[label] = [0, 0, 0, 0, 0]
+                count = counts[label]
+                if outDegree > 0:
+                    count[0] += outDegree
+                    count[1] += 1
+                    count[2] = max(count[2], outDegree)
+                if inDegree > 0:
+                    count[3] += 1
+                    count[4] = max(count[4], inDegree)
+        labels = {label: LabelStatistics(label, *count) for label, count in counts.items() if count[0] > 0}
+        self.statistics = GraphStatistics(labels, self.version, self.labelsVersion)
+        return self.statistics
+
+    #whether node has at least one relationship in the graph
+    def hasNode(self, node):
+        return node in self.index
+
+    #returns the pair of lists (outgoing, incoming) of the neighbors of node by label, adding empty
+    #ones if node has no neighbors by label yet
+    def neighborLists(self, node, label):
+        labels = self.index.get(node)
+        if labels is None:
+            labels = self.index[node] = {}
+        pair = labels.get(label)
+        if pair is None:
+            pair = labels[label] = ([], [])
+        return pair
+
+    #forgets that neighbor can be reached from node by following label in direction, dropping the
+    #label and then the node once they have no neighbors left
+    def unindexNeighbor(self, node, label, direction, neighbor):
+        labels = self.index[node]
+        pair = labels[label]
+        pair[0 if direction == OUTGOING else 1].remove(neighbor)
+        if not pair[0] and not pair[1]:
+            del labels[label]
+            if not labels:
+                del self.index[node]
+
+    #returns the nodes reachable from node by following a single edge of type edgeType
+    # e.g. neighbors(node, "parent") returns node's parents, neighbors(node, "-parent") returns node's children
+    def neighbors(self, node, edgeType):
+        label, direction = parseEdgeType(edgeType)
+        labels = self.index.get(node)
+        if labels is None or label not in labels:
+            return []
+        return labels[label][0 if direction == OUTGOING else 1]
+
+    #returns every edge of the graph as (label, left node, right node), once per edge
+    def edgeList(self):
+        edges = []
+        for node, labels in self.index.items():
+            #every edge is in the outgoing list of its left node
+            for label, (outgoing, incoming) in labels.items():
+                for neighbor in outgoing:
+                    edges.append((label, node, neighbor))
+        return edges
 
     #tests whether source is connected with destination using sequence of relationships in edgeTypes
     # e.g. if edgeTypes holds ['parent', 'sibling'], tests if destination is source's parent's sibling
-    def hasRelationship(self, edgeTypes, source, destination):
+    #stats = optional instrument.QueryStats counting the work done, depth = hops walked so far including this one
+    def hasRelationship(self, edgeTypes, source, destination, stats = None, depth = 1):
         if type(source) is not Node or type(destination) is not Node:
             raise TypeError("hasRelationship method in class Graph must be passed Node objects for source and destination")
 
         #if neither source nor destination is connected to any other nodes (e.g. no relationships), return early
-        if source not in self.graph:
+        if source not in self.index:
             return False
-        if destination not in self.graph:
+        if destination not in self.index:
             return False
 
-        for edge in self.graph[source]:
-            #see if edge connects source with another node with relationship edgeTypes[0]
-            if edgeTypes[0].find("-") != -1:
-                #if relationship in edgeTypes[0] has a preceding -, relationship must go from source to another node
-                if edgeTypes[0][1:] == edge.relationshipIdentifier and edge.left.name == source.name:
-                    #if we are on the last edge in the list, check if destination node matches
-                    if len(edgeTypes) == 1:
-                        if(edge.right.name == destination.name):
-                            return True
-                    else:
-                        #recursion- we have connected source with one node, try to connect next node
-                        result = self.hasRelationship(edgeTypes[1:], edge.right, destination)
-                        if result:
-                            return result
+        #only the neighbors connected through edgeTypes[0] in the right direction are candidates
+        neighbors = self.neighbors(source, edgeTypes[0])
+        if stats is not None:
+            stats.expanded(edgeTypes[0], 1, len(neighbors), depth)
+        for neighbor in neighbors:
+            #if we are on the last edge in the list, check if destination node matches
+            if len(edgeTypes) == 1:
+                if neighbor.name == destination.name:
+                    return True
             else:
-                #if no preceding - in edgeTypes[0], relationship must go from another node to source
-                if edgeTypes[0] == edge.relationshipIdentifier and edge.right.name == source.name:
-                    #if we are on the last edge in the list, check if destination node matches
-                    if len(edgeTypes) == 1:
-                        if(edge.left.name == destination.name):
-                            return True
-                    else:
-                        #recursion- we have connected source with one node, try to connect next node
-                        result = self.hasRelationship(edgeTypes[1:], edge.left, destination)
-                        if result:
-                            return result
+                #recursion- we have connected source with one node, try to connect next node
+                result = self.hasRelationship(edgeTypes[1:], neighbor, destination, stats, depth + 1)
+                if result:
+                    return result
         return False
+
+    #returns the number of edges of type edgeType that can be followed from node
+    def degree(self, node, edgeType):
+        return len(self.neighbors(node, edgeType))
+
+    #returns the set of nodes reachable from any node in frontier by following a single edge of type edgeType
+    #stats = optional instrument.QueryStats counting the work done, depth = hops walked including this one
+    def expand(self, frontier, edgeType, stats = None, depth = 0):
+        reached = set()
+        edges = 0
+        for node in frontier:
+            neighbors = self.neighbors(node, edgeType)
+            edges += len(neighbors)
+            reached.update(neighbors)
+        if stats is not None:
+            stats.expanded(edgeType, len(frontier), edges, depth)
+        return reached
+
+    #frontiers are the sets of people the compiled plans walk relationship paths with (see plan.py)
+    #every graph picks the form that is cheapest for it to expand, a Graph uses sets of Nodes
+    #returns the frontier holding only node
+    def frontierOf(self, node):
+        return {node}
+
+    #returns the frontier reached from frontier by following a single edge of type edgeType
+    def expandFrontier(self, frontier, edgeType, stats = None, depth = 0):
+        return self.expand(frontier, edgeType, stats, depth)
+
+    #whether node is in frontier
+    def inFrontier(self, frontier, node):
+        return node in frontier
+
+    #returns the set of names of the people in frontier
+    def frontierNames(self, frontier):
+        return {node.name for node in frontier}
+
+    #same answer as hasRelationship, but walks the path one hop at a time, holding the nodes
+    #reached so far as a set so each node is only expanded once per hop
+    def hasRelationshipFrontier(self, edgeTypes, source, destination, stats = None):
+        if type(source) is not Node or type(destination) is not Node:
+            raise TypeError("hasRelationshipFrontier method in class Graph must be passed Node objects for source and destination")
+
+        if source not in self.index:
+            return False
+        if destination not in self.index:
+            return False
+
+        frontier = {source}
+        for depth in range(1, len(edgeTypes)):
+            frontier = self.expand(frontier, edgeTypes[depth - 1], stats, depth)
+            #no node can continue the path
+            if not frontier:
+                return False
+
+        #last hop, stop as soon as destination is reached
+        for node in frontier:
+            neighbors = self.neighbors(node, edgeTypes[-1])
+            if stats is not None:
+                stats.expanded(edgeTypes[-1], 1, len(neighbors), len(edgeTypes))
+            for neighbor in neighbors:
+                if neighbor.name == destination.name:
+                    return True
+        return False
+
+    #same answer as hasRelationship, but searches from both ends of the path at once
+    #source is walked forward along the start of edgeTypes, destination is walked backwards
+    #along the end of edgeTypes (using reversed edge types). whichever side has fewer edges
+    #to follow for its next hop is expanded, so the split point follows the degrees of the
+    #nodes involved. succeeds when both sides have covered the whole path and share a node
+    def hasRelationshipBidirectional(self, edgeTypes, source, destination, stats = None):
+        if type(source) is not Node or type(destination) is not Node:
+            raise TypeError("hasRelationshipBidirectional method in class Graph must be passed Node objects for source and destination")
+
+        if source not in self.index:
+            return False
+        if destination not in self.index:
+            return False
+
+        forward = {source}
+        backward = {destination}
+        #edgeTypes[:first] have been walked from source, edgeTypes[last:] have been walked from destination
+        first = 0
+        last = len(edgeTypes)
+        while first < last:
+            forwardCost = sum(self.degree(node, edgeTypes[first]) for node in forward)
+            backwardEdgeType = reverseEdgeType(edgeTypes[last - 1])
+            backwardCost = sum(self.degree(node, backwardEdgeType) for node in backward)
+            if forwardCost <= backwardCost:
+                forward = self.expand(forward, edgeTypes[first], stats, first + 1)
+                first += 1
+            else:
+                backward = self.expand(backward, backwardEdgeType, stats, len(edgeTypes) - last + 1)
+                last -= 1
+
+            #one side ran out of nodes, the path cannot be completed
+            if not forward or not backward:
+                return False
+
+        return not forward.isdisjoint(backward)
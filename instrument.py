@@ -0,0 +1,111 @@
+#Optional instrumentation of access queries.
+#A QueryStats collects counters for one query as it is evaluated: it is passed down through
+#driver.hasAccess, driver.relatedVia, the compiled plans and the graph's search methods, which only
+#count anything when they are given one. Without instrumentation the only cost is checking
+#whether stats is None.
+#A Profiler creates the QueryStats of every query it is given to (driver.hasAccess(..., profiler =)),
+#runs any registered hooks on them, logs a sample of slow queries, and aggregates per resource and
+#per label hot spots over a run.
+
+import logging, random
+from graph import parseEdgeType
+
+#counters for one query
+class QueryStats:
+    def __init__(self, resource = None, accessor = None, permission = None):
+        self.resource = resource
+        self.accessor = accessor
+        self.permission = permission
+        self.statementsEvaluated = 0    #statements whose relationship was checked
+        self.statementsSkipped = 0      #statements skipped because they cannot grant permission
+        self.edgesScanned = 0           #edges followed while walking relationship paths
+        self.nodesVisited = 0           #people expanded while walking relationship paths
+        self.maxDepth = 0               #most hops walked along one relationship path
+        self.labelEdges = {}            #maps label to the edges of that label followed
+        self.grantedBy = None           #the statement that granted access, if one did
+        self.cacheHit = False           #whether the decision came from an AccessCache
+        self.seconds = 0.0
+
+    #records that nodes people were expanded through edgeType, following edges edges,
+    #depth hops along a relationship path
+    def expanded(self, edgeType, nodes, edges, depth):
+        self.nodesVisited += nodes
+        self.edgesScanned += edges
+        label = parseEdgeType(edgeType)[0]
+        self.labelEdges[label] = self.labelEdges.get(label, 0) + edges
+        if depth > self.maxDepth:
+            self.maxDepth = depth
+
+    #records the statement that granted access, anchor is the owner or delegator it was checked from
+    def granted(self, statement, anchor):
+        self.grantedBy = "{} from {}".format(statement.describe(), anchor)
+
+    def toDict(self):
+        return dict(self.__dict__)
+
+#aggregate counters for a group of queries, e.g. every query on one resource
+class HotSpot:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.edgesScanned = 0
+        self.nodesVisited = 0
+
+    def add(self, seconds, edges, nodes):
+        self.queries += 1
+        self.seconds += seconds
+        self.edgesScanned += edges
+        self.nodesVisited += nodes
+
+    def toDict(self):
+        return dict(self.__dict__)
+
+#collects the QueryStats of queries over a run
+#slowQuerySeconds = queries taking at least this long are logged, None to log none
+#sampleRate = fraction of slow queries that are logged
+#logger = where slow queries are logged
+class Profiler:
+    def __init__(self, slowQuerySeconds = None, sampleRate = 1.0, logger = None, seed = None):
+        self.slowQuerySeconds = slowQuerySeconds
+        self.sampleRate = sampleRate
+        self.logger = logger if logger is not None else logging.getLogger("policy.slowqueries")
+        self.random = random.Random(seed)
+        self.hooks = []
+        self.queries = 0
+        self.resources = {}     #maps resource to its HotSpot
+        self.labels = {}        #maps label to its HotSpot, counting the queries that followed that label
+
+    #registers callback to be called with the QueryStats of every query once it is answered
+    def addHook(self, callback):
+        self.hooks.append(callback)
+
+    def removeHook(self, callback):
+        self.hooks.remove(callback)
+
+    #returns the QueryStats to collect for a new query
+    def start(self, resource, accessor, permission):
+        return QueryStats(resource, accessor, permission)
+
+    #records the QueryStats of an answered query
+    def record(self, stats):
+        self.queries += 1
+        self.resources.setdefault(stats.resource, HotSpot()).add(stats.seconds, stats.edgesScanned, stats.nodesVisited)
+        for label, edges in stats.labelEdges.items():
+            self.labels.setdefault(label, HotSpot()).add(stats.seconds, edges, 0)
+
+        for hook in self.hooks:
+            hook(stats)
+
+        if self.slowQuerySeconds is not None and stats.seconds >= self.slowQuerySeconds:
+            if self.sampleRate >= 1.0 or self.random.random() < self.sampleRate:
+                self.logger.warning("slow query %.6fs: %s", stats.seconds, stats.toDict())
+
+    #returns the count hottest resources and labels, by total time and edges scanned respectively
+    def hotSpots(self, count = 10):
+        resources = sorted(self.resources.items(), key = lambda item: item[1].seconds, reverse = True)[:count]
+        labels = sorted(self.labels.items(), key = lambda item: item[1].edgesScanned, reverse = True)[:count]
+        return {
+            "queries": self.queries,
+            "resources": [(resource, hotSpot.toDict()) for resource, hotSpot in resources],
+            "labels": [(label, hotSpot.toDict()) for label, hotSpot in labels]
+        }
@@ -0,0 +1,97 @@
+#Reports how much memory a social network takes, broken down by what holds it, and the bytes it
+#takes per edge.
+#Sizes are the shallow sizes (sys.getsizeof) of every object the graph holds, each counted once:
+#shared objects such as interned label strings are not counted twice. NumPy arrays are counted by
+#their buffers.
+#The social network can be read from a policy file or generated with bench.py's generator, to check
+#bytes per edge at a given scale.
+#
+#usage: python memory.py [policyFile] [--people N] [--engine dict|csr]
+
+import argparse, os, sys, tempfile
+
+#returns the memory report of socialNetwork, with nodes the dict mapping names to its nodes
+def memoryReport(socialNetwork, nodes):
+    if hasattr(socialNetwork, "csr"):
+        components = csrComponents(socialNetwork, nodes)
+        engine = "csr"
+    else:
+        components = graphComponents(socialNetwork, nodes)
+        engine = "dict"
+    edges = len(socialNetwork.edgeList())
+    total = sum(components.values())
+    return {
+        "engine": engine,
+        "people": len(nodes),
+        "edges": edges,
+        "components": components,
+        "total": total,
+        "bytesPerEdge": total / edges if edges else 0.0
+    }
+
+#the bytes held by the people in nodes: the dict, the Nodes and their names
+def nodeBytes(nodes):
+    size = sys.getsizeof(nodes)
+    for name, node in nodes.items():
+        size += sys.getsizeof(node) + sys.getsizeof(name)
+    return size
+
+def graphComponents(socialNetwork, nodes):
+    index = sys.getsizeof(socialNetwork.index)
+    labels = {}
+    for nodeLabels in socialNetwork.index.values():
+        index += sys.getsizeof(nodeLabels)
+        for label, pair in nodeLabels.items():
+            labels[id(label)] = label
+            index += sys.getsizeof(pair) + sys.getsizeof(pair[0]) + sys.getsizeof(pair[1])
+
+    return {
+        "nodes": nodeBytes(nodes),
+        "index": index,
+        "labels": sum(sys.getsizeof(label) for label in labels.values())
+    }
+
+def csrComponents(socialNetwork, nodes):
+    socialNetwork.build()
+    csr = 0
+    for arrays in socialNetwork.forward + socialNetwork.backward:
+        csr += sum(array.nbytes for array in arrays)
+    return {
+        "nodes": nodeBytes(nodes) + sys.getsizeof(socialNetwork.ids) + sys.getsizeof(socialNetwork.people),
+        "edgeArrays": sum(sys.getsizeof(array) for array in (socialNetwork.edgeLabels, socialNetwork.edgeLefts,
+                                                              socialNetwork.edgeRights, socialNetwork.edgeCounts,
+                                                              socialNetwork.labelCounts)),
+        "csr": csr,
+        "labels": sys.getsizeof(socialNetwork.labels) + sum(sys.getsizeof(label) for label in socialNetwork.labelNames)
+    }
+
+def printReport(report):
+    print("{} engine, {} people, {} edges".format(report["engine"], report["people"], report["edges"]))
+    for component, size in report["components"].items():
+        print("  {:<12}{:>14,} bytes".format(component, size))
+    print("  {:<12}{:>14,} bytes, {:.1f} bytes per edge".format("total", report["total"], report["bytesPerEdge"]))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Report the memory a social network takes per edge")
+    parser.add_argument("policyFile", nargs = "?", help = "policy file to read the social network from")
+    parser.add_argument("--people", type = int, help = "generate a synthetic social network of this many people instead, see bench.py")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--engine", choices = ["dict", "csr"], default = "dict")
+    args = parser.parse_args()
+
+    from driver import preprocess
+    if args.people is not None:
+        from bench import GeneratorConfig, generatePolicyFile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "policy.json")
+            edgePath = generatePolicyFile(GeneratorConfig(args.people, args.seed), path)[0]
+            permissions, socialNetwork, nodes, resources = preprocess(path, engine = args.engine, edgeFile = edgePath)
+    elif args.policyFile is not None:
+        permissions, socialNetwork, nodes, resources = preprocess(args.policyFile, engine = args.engine)
+    else:
+        parser.error("a policy file or --people must be given")
+
+    printReport(memoryReport(socialNetwork, nodes))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#Validates delegations across a pool of workers. Resources are independent of each other when
+#validating delegations (a delegation can only depend on the policy and earlier delegations of its
+#own resource), so resources are split into contiguous chunks and each worker validates whole
+#resources, in order, against a private copy of their policy. The social network is shared
+#read-only: worker processes inherit it when they are forked, or receive one copy each when
+#processes have to be spawned. Threads share it directly. Social networks that can only be used
+#from the process that made them (PartitionedGraph) are always shared with threads.
+#Results are merged back in resource order, so the delegations added and the SyntaxError raised
+#for the first invalid delegation are the same as when validating sequentially.
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from statements import Delegation, internStatement
+
+#(resources, socialNetwork, nodes, permissions) seen by worker processes
+sharedState = None
+
+def setSharedState(state):
+    global sharedState
+    sharedState = state
+
+#preprocesses filename (through snapshot, if given, and with the relationships in edgeFile, if given)
+#in a spawned worker process and shares the result
+def loadSharedState(filename, snapshot = None, edgeFile = None):
+    from driver import preprocess
+    permissions, socialNetwork, nodes, resources = preprocess(filename, snapshot = snapshot, edgeFile = edgeFile)
+    setSharedState((resources, socialNetwork, nodes, permissions))
+
+#returns a pool of workers processes that see state as sharedState
+#forked workers inherit it, spawned workers preprocess source = (filename, snapshot, edgeFile) themselves
+#(or are sent a copy of state if source is None)
+#a pool of threads is returned instead if the social network in state cannot leave this process
+def sharedStatePool(state, workers, source = None):
+    setSharedState(state)
+    if getattr(state[1], "processLocal", False):
+        return ThreadPoolExecutor(max_workers = workers)
+    if "fork" in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers = workers, mp_context = multiprocessing.get_context("fork"))
+    if source is not None:
+        return ProcessPoolExecutor(max_workers = workers, initializer = loadSharedState, initargs = source)
+    return ProcessPoolExecutor(max_workers = workers, initializer = setSharedState, initargs = (state,))
+
+#validates the delegations of every resource in resources that has any, using workers workers
+#executor is "process" or "thread"
+#valid delegations are appended to the resources' policies, raises SyntaxError for the first invalid one
+def processDelegationsParallel(resources, socialNetwork, nodes, permissions, workers, executor = "process"):
+    pending = [resource for resource in resources if "delegations" in resources[resource]]
+    if not pending:
+        return
+
+    #several chunks per worker so one slow chunk does not hold up the rest
+    chunkCount = min(len(pending), workers * 4)
+    chunkSize = -(-len(pending) // chunkCount)
+    chunks = [pending[i:i + chunkSize] for i in range(0, len(pending), chunkSize)]
+
+    state = (resources, socialNetwork, nodes, permissions)
+    if executor == "thread":
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            results = list(pool.map(lambda chunk: validateChunk(chunk, state), chunks))
+    elif executor == "process":
+        try:
+            #forked workers inherit sharedState without copying it through a pipe
+            with sharedStatePool(state, workers) as pool:
+                results = list(pool.map(validateSharedChunk, chunks))
+        finally:
+            setSharedState(None)
+        #Delegations sent back by worker processes are unpickled copies, share the interned statements again
+        results = [[(resource, [internDelegation(delegation) for delegation in delegations], error)
+                    for resource, delegations, error in chunkResults] for chunkResults in results]
+    else:
+        raise ValueError("Unknown executor for delegation validation: {}".format(executor))
+
+    for chunkResults in results:
+        for resource, delegations, error in chunkResults:
+            if error is not None:
+                raise SyntaxError(error)
+            policy = resources[resource]["policy"]
+            for delegation in delegations:
+                policy.addDelegation(delegation)
+
+#returns delegation with its relationship statement replaced by the interned one
+def internDelegation(delegation):
+    relationship = delegation.relationship
+    relationship = internStatement(relationship.owner, relationship.everyone, relationship.negation, relationship.labels, relationship.permissions)
+    return Delegation(relationship, delegation.delegator)
+
+#validates chunk against the state inherited by (or sent to) a worker process
+def validateSharedChunk(chunk):
+    return validateChunk(chunk, sharedState)
+
+#returns (resource, valid Delegations in order, error message or None) for every resource in chunk
+#validation of a resource stops at its first invalid delegation
+def validateChunk(chunk, state):
+    from driver import validateDelegation, compilePolicy
+    resources, socialNetwork, nodes, permissions = state
+
+    results = []
+    for resource in chunk:
+        entry = resources[resource]
+        #a private copy of the policy, so the shared resources are never modified by workers
+        policy = compilePolicy(list(entry["policy"].statements))
+        view = {resource: dict(entry, policy = policy)}
+        delegations = []
+        error = None
+        for delegator in entry["delegations"]:
+            try:
+                delegation = validateDelegation(resource, delegator, view, socialNetwork, nodes, permissions)
+            except SyntaxError as e:
+                error = str(e)
+                break
+            policy.addDelegation(delegation)
+            delegations.append(delegation)
+        results.append((resource, delegations, error))
+    return results
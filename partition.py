@@ -0,0 +1,368 @@
+#A partitioned social network, split across worker processes, with the same query methods as Graph.
+#People are assigned to one of N shards by a stable hash of their name (zlib.crc32, so the
+#assignment is the same in every process and every run). Each shard is a worker process owning the
+#adjacency of its people: the outgoing edges of an edge are held by the shard of its left person
+#and the incoming edges by the shard of its right person, so any edge type can be followed from a
+#person by asking only that person's shard.
+#A PartitionedGraph is the coordinator. It talks to the shards over multiprocessing pipes and walks
+#relationship paths as rounds of frontier exchange: every hop sends each shard the part of the
+#frontier it owns, in one message per shard, and the union of their answers is the next frontier.
+#The coordinator itself only keeps the Node objects and how many edges each person has.
+#A PartitionedGraph can only be used from the process that made it, and is made safe to use from
+#several threads by a lock around every round, so worker pools using it are pools of threads (see
+#parallel.sharedStatePool).
+#The shard processes run until close() is called, the graph is used as a context manager, or the
+#coordinator exits.
+
+import atexit, multiprocessing, os, threading, zlib
+from graph import Node, OUTGOING, parseEdgeType, reverseEdgeType, labelVersions, LabelStatistics, GraphStatistics
+
+#number of shards used by newGraph("partitioned")
+defaultShards = 4
+
+#returns the shard, out of shards, that owns the person named name
+def shardOf(name, shards):
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+#the adjacency held by one shard, maps name to label to a pair of lists (outgoing, incoming) of names
+#as in Graph.index
+class Shard:
+    def __init__(self):
+        self.adjacency = {}
+
+    #adds neighbor to the outgoing (slot 0) or incoming (slot 1) neighbors of name through label
+    #returns whether it was added, False if it already was a neighbor
+    def add(self, label, name, neighbor, slot):
+        labels = self.adjacency.setdefault(name, {})
+        if label not in labels:
+            labels[label] = ([], [])
+        neighbors = labels[label][slot]
+        if neighbor in neighbors:
+            return False
+        neighbors.append(neighbor)
+        return True
+
+    #removes neighbor from the neighbors of name, returns whether it was a neighbor
+    def remove(self, label, name, neighbor, slot):
+        labels = self.adjacency.get(name)
+        if labels is None or label not in labels or neighbor not in labels[label][slot]:
+            return False
+        labels[label][slot].remove(neighbor)
+        if not labels[label][0] and not labels[label][1]:
+            del labels[label]
+            if not labels:
+                del self.adjacency[name]
+        return True
+
+    #returns the neighbors of name through edgeType
+    def neighbors(self, name, edgeType):
+        label, direction = parseEdgeType(edgeType)
+        labels = self.adjacency.get(name)
+        if labels is None or label not in labels:
+            return []
+        return labels[label][0 if direction == OUTGOING else 1]
+
+    #returns (reached, edges): the names reached from names by following edgeType once, and the
+    #number of edges followed
+    def expand(self, names, edgeType):
+        reached = set()
+        edges = 0
+        for name in names:
+            neighbors = self.neighbors(name, edgeType)
+            edges += len(neighbors)
+            reached.update(neighbors)
+        return reached, edges
+
+    #returns the number of edges of type edgeType that can be followed from names
+    def degree(self, names, edgeType):
+        return sum(len(self.neighbors(name, edgeType)) for name in names)
+
+    #returns every edge whose left person is in this shard, as (label, left name, right name)
+    def edges(self):
+        return [(label, name, neighbor) for name, labels in self.adjacency.items()
+                for label, (outgoing, incoming) in labels.items() for neighbor in outgoing]
+
+    #returns this shard's share of the degree statistics, maps label to
+    #[edges, sources, maxOut, targets, maxIn] counted over the people in this shard
+    def statistics(self):
+        counts = {}
+        for labels in self.adjacency.values():
+            for label, (outgoing, incoming) in labels.items():
+                count = counts.setdefault(label, [0, 0, 0, 0, 0])
+                if outgoing:
+                    count[0] += len(outgoing)
+                    count[1] += 1
+                    count[2] = max(count[2], len(outgoing))
+                if incoming:
+                    count[3] += 1
+                    count[4] = max(count[4], len(incoming))
+        return counts
+
+#the loop run by every shard's worker process: answers ("method", arguments...) messages with the
+#result of calling that method of its Shard, until it is sent None
+def runShard(connection):
+    shard = Shard()
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        try:
+            result = getattr(shard, message[0])(*message[1:])
+        except Exception as e:
+            result = e
+        connection.send(result)
+    connection.close()
+
+class PartitionedGraph:
+    processLocal = True     #can only be used from the process that made it, see parallel.sharedStatePool
+
+    def __init__(self, shards = None):
+        if shards is None:
+            shards = defaultShards
+        self.shards = shards
+        self.people = {}            #maps name to Node, for every person with edges
+        self.edgeCounts = {}        #maps name to the number of edges touching that person
+        self.version = 0
+        self.labelCounts = {}       #see Graph
+        self.labelsVersion = next(labelVersions)
+        self.statistics = None
+        self.observers = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.connections = []
+        self.processes = []
+        for i in range(shards):
+            connection, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target = runShard, args = (child,), daemon = True)
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    #stops the shard worker processes
+    def close(self):
+        if self.connections and os.getpid() == self.pid:
+            atexit.unregister(self.close)
+            for connection in self.connections:
+                connection.send(None)
+            for process in self.processes:
+                process.join()
+        self.connections = []
+        self.processes = []
+
+    #sends every (shard, message) in requests, then returns the shards' answers in the same order
+    #at most one large message should go to each shard per round, so no shard blocks on a full pipe
+    def request(self, requests):
+        if os.getpid() != self.pid:
+            raise RuntimeError("A PartitionedGraph can only be used from the process that made it")
+        with self.lock:
+            for shard, message in requests:
+                self.connections[shard].send(message)
+            results = [self.connections[shard].recv() for shard, message in requests]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    #sends message, followed by a part of names, to every shard that owns any of names
+    #returns the shards' answers
+    def scatter(self, method, names, *arguments):
+        parts = {}
+        for name in names:
+            parts.setdefault(shardOf(name, self.shards), []).append(name)
+        return self.request([(shard, (method, part) + arguments) for shard, part in parts.items()])
+
+    #add a new edge to the graph, indicating that node1 has relationship <relationshipIdentifier> with node2
+    #returns whether the edge was added, False if the graph already had it
+    def addEdge(self, relationshipIdentifier, node1, node2):
+        added = self.request([(shardOf(node1.name, self.shards), ("add", relationshipIdentifier, node1.name, node2.name, 0)),
+                              (shardOf(node2.name, self.shards), ("add", relationshipIdentifier, node2.name, node1.name, 1))])
+        if not added[0]:
+            return False
+        for node in (node1, node2):
+            self.people.setdefault(node.name, node)
+            self.edgeCounts[node.name] = self.edgeCounts.get(node.name, 0) + 1
+        count = self.labelCounts.get(relationshipIdentifier, 0)
+        if count == 0:
+            self.labelsVersion = next(labelVersions)
+        self.labelCounts[relationshipIdentifier] = count + 1
+        self.version += 1
+        for observer in self.observers:
+            observer.edgeAdded(relationshipIdentifier, node1, node2)
+        return True
+
+    #remove the edge indicating that node1 has relationship <relationshipIdentifier> with node2
+    #returns whether such an edge existed
+    def removeEdge(self, relationshipIdentifier, node1, node2):
+        if not self.hasNode(node1) or not self.hasNode(node2):
+            return False
+        removed = self.request([(shardOf(node1.name, self.shards), ("remove", relationshipIdentifier, node1.name, node2.name, 0)),
+                                (shardOf(node2.name, self.shards), ("remove", relationshipIdentifier, node2.name, node1.name, 1))])
+        if not removed[0]:
+            return False
+        for node in (node1, node2):
+            self.edgeCounts[node.name] -= 1
+            if self.edgeCounts[node.name] == 0:
+                del self.edgeCounts[node.name]
+                del self.people[node.name]
+        self.labelCounts[relationshipIdentifier] -= 1
+        self.version += 1
+        for observer in self.observers:
+            observer.edgeRemoved(relationshipIdentifier, node1, node2)
+        return True
+
+    #see Graph.addObserver
+    def addObserver(self, observer):
+        self.observers.append(observer)
+
+    def removeObserver(self, observer):
+        self.observers.remove(observer)
+
+    #whether node has at least one relationship in the graph
+    def hasNode(self, node):
+        return node.name in self.edgeCounts
+
+    #returns every edge of the graph as (label, left node, right node), once per edge
+    def edgeList(self):
+        edges = []
+        for shardEdges in self.request([(shard, ("edges",)) for shard in range(self.shards)]):
+            edges.extend((label, self.people[left], self.people[right]) for label, left, right in shardEdges)
+        return edges
+
+    #returns the GraphStatistics of the graph as it is now, see Graph.labelStatistics
+    def labelStatistics(self):
+        if self.statistics is not None and self.statistics.version == self.version:
+            return self.statistics
+        counts = {}
+        for shardCounts in self.request([(shard, ("statistics",)) for shard in range(self.shards)]):
+            for label, shardCount in shardCounts.items():
+                count = counts.setdefault(label, [0, 0, 0, 0, 0])
+                count[0] += shardCount[0]
+                count[1] += shardCount[1]
+                count[2] = max(count[2], shardCount[2])
+                count[3] += shardCount[3]
+                count[4] = max(count[4], shardCount[4])
+        labels = {label: LabelStatistics(label, *count) for label, count in counts.items() if count[0] > 0}
+        self.statistics = GraphStatistics(labels, self.version, self.labelsVersion)
+        return self.statistics
+
+    #returns (reached, edges): the set of names reached from the names in frontier by following
+    #edgeType once, in one round, and the number of edges followed
+    def expandNames(self, frontier, edgeType):
+        reached = set()
+        edges = 0
+        for shardReached, shardEdges in self.scatter("expand", frontier, edgeType):
+            reached.update(shardReached)
+            edges += shardEdges
+        return reached, edges
+
+    #returns the number of edges of type edgeType that can be followed from the names in frontier
+    def degreeNames(self, frontier, edgeType):
+        return sum(self.scatter("degree", frontier, edgeType))
+
+    #returns the nodes reachable from node by following a single edge of type edgeType
+    def neighbors(self, node, edgeType):
+        if not self.hasNode(node):
+            return []
+        return [self.people[name] for name in self.expandNames([node.name], edgeType)[0]]
+
+    #returns the number of edges of type edgeType that can be followed from node
+    def degree(self, node, edgeType):
+        if not self.hasNode(node):
+            return 0
+        return self.degreeNames([node.name], edgeType)
+
+    #returns the set of nodes reachable from any node in frontier by following a single edge of type edgeType
+    #stats = optional instrument.QueryStats counting the work done, depth = hops walked including this one
+    def expand(self, frontier, edgeType, stats = None, depth = 0):
+        names = [node.name for node in frontier if self.hasNode(node)]
+        reached, edges = self.expandNames(names, edgeType)
+        if stats is not None:
+            stats.expanded(edgeType, len(names), edges, depth)
+        return {self.people[name] for name in reached}
+
+    #frontiers of the compiled plans (see Graph.frontierOf) are sets of names, as sent to the shards
+    def frontierOf(self, node):
+        if not self.hasNode(node):
+            return set()
+        return {node.name}
+
+    def expandFrontier(self, frontier, edgeType, stats = None, depth = 0):
+        reached, edges = self.expandNames(frontier, edgeType)
+        if stats is not None:
+            stats.expanded(edgeType, len(frontier), edges, depth)
+        return reached
+
+    def inFrontier(self, frontier, node):
+        return node.name in frontier
+
+    def frontierNames(self, frontier):
+        return frontier
+
+    #tests whether source is connected with destination using sequence of relationships in edgeTypes
+    #every hop is one round of frontier exchange, so this is the same search as hasRelationshipFrontier
+    def hasRelationship(self, edgeTypes, source, destination, stats = None, depth = 1):
+        if type(source) is not Node or type(destination) is not Node:
+            raise TypeError("hasRelationship method in class PartitionedGraph must be passed Node objects for source and destination")
+        if not self.hasNode(source) or not self.hasNode(destination):
+            return False
+
+        frontier = {source.name}
+        for edgeType in edgeTypes:
+            walked = len(frontier)
+            frontier, edges = self.expandNames(frontier, edgeType)
+            if stats is not None:
+                stats.expanded(edgeType, walked, edges, depth)
+                depth += 1
+            #no node can continue the path
+            if not frontier:
+                return False
+        return destination.name in frontier
+
+    def hasRelationshipFrontier(self, edgeTypes, source, destination, stats = None):
+        return self.hasRelationship(edgeTypes, source, destination, stats)
+
+    #same answer as hasRelationship, searching from both ends of the path at once
+    #each round expands whichever side follows fewer edges
+    def hasRelationshipBidirectional(self, edgeTypes, source, destination, stats = None):
+        if type(source) is not Node or type(destination) is not Node:
+            raise TypeError("hasRelationshipBidirectional method in class PartitionedGraph must be passed Node objects for source and destination")
+        if not self.hasNode(source) or not self.hasNode(destination):
+            return False
+
+        forward = {source.name}
+        backward = {destination.name}
+        first = 0
+        last = len(edgeTypes)
+        while first < last:
+            backwardEdgeType = reverseEdgeType(edgeTypes[last - 1])
+            forwardCost = self.degreeNames(forward, edgeTypes[first])
+            backwardCost = self.degreeNames(backward, backwardEdgeType)
+            if forwardCost <= backwardCost:
+                if stats is not None:
+                    stats.expanded(edgeTypes[first], len(forward), forwardCost, first + 1)
+                forward = self.expandNames(forward, edgeTypes[first])[0]
+                first += 1
+            else:
+                if stats is not None:
+                    stats.expanded(backwardEdgeType, len(backward), backwardCost, len(edgeTypes) - last + 1)
+                backward = self.expandNames(backward, backwardEdgeType)[0]
+                last -= 1
+
+            #one side ran out of nodes, the path cannot be completed
+            if not forward or not backward:
+                return False
+
+        return not forward.isdisjoint(backward)
+
+    #prints the status of the graph
+    def printGraph(self):
+        for label, left, right in self.edgeList():
+            print("({}, {}, {})".format(label, left.name, right.name))
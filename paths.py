@@ -0,0 +1,201 @@
+#An opt-in materialized index of the relationship paths referenced by the resources' policies.
+#For every (anchor, label path) a policy can evaluate, the anchor being the owner of the resource or
+#the delegator of a Delegation, a PathIndex holds the names of the people at the end of the path,
+#so relatedVia and the compiled plans can answer with a set lookup instead of walking the graph.
+#Alongside the end of the path it keeps every layer of the walk: layers[i] holds the people reached
+#after i hops. The index observes the social network (Graph.addObserver), and when an edge of a label
+#on the path is added or removed from a person in the layer it is followed from, only the layers
+#after that one are walked again.
+#Entries are bounded by maxEntries and by maxMembers, the total number of names held in all layers
+#of all entries. Paths that do not fit, or grow past the limit as the graph changes, are left out and
+#answered by walking the graph live, as are all paths if the graph changed without the index seeing
+#it (e.g. CSRGraph.loadEdges). Left out paths are tried again once room is freed: when an edge of a
+#label on the path is removed, or when entries are dropped.
+#Every path is kept only while the policy of some resource uses it, so replacing a policy (see
+#addResource) drops the paths only the old policy used.
+
+from statements import RelationshipStatement, Delegation
+from graph import parseEdgeType, OUTGOING
+
+class PathIndex:
+    #socialNetwork, nodes = the social network the paths are walked in and the dict mapping names to
+    #its nodes, kept up to date by whoever changes the social network
+    def __init__(self, socialNetwork, nodes, maxEntries = 100000, maxMembers = 10000000):
+        self.socialNetwork = socialNetwork
+        self.nodes = nodes
+        self.maxEntries = maxEntries
+        self.maxMembers = maxMembers
+        self.entries = {}       #maps (anchor, labels) to the layers of the walk along labels from anchor
+        self.labelEntries = {}  #maps label to the keys of the entries whose path uses it
+        self.members = 0        #total number of names held in the layers of all entries
+        self.overflow = set()   #keys of the paths left out because of the limits
+        self.resourcePaths = {} #maps resource name to the keys of the paths its policy uses
+        self.users = {}         #maps the key of every path in entries or overflow to the number of resources using it
+        self.version = socialNetwork.version
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+        socialNetwork.addObserver(self)
+
+    #stops observing the social network
+    def close(self):
+        self.socialNetwork.removeObserver(self)
+
+    #materializes every path the policies in resources can evaluate
+    def addResources(self, resources):
+        for resource in resources:
+            self.addResource(resource, resources[resource])
+
+    #materializes every path the policy of the resource named name (entry = its entry of resources)
+    #can evaluate, in place of the paths of the policy it had when last added
+    def addResource(self, name, entry):
+        keys = set()
+        for statement in entry["policy"].statements:
+            if type(statement) is RelationshipStatement:
+                anchor, labels = entry["owner"], statement.labels
+            elif type(statement) is Delegation:
+                anchor, labels = statement.delegator, statement.relationship.labels
+            else:
+                continue
+            if labels:
+                keys.add((anchor, tuple(labels)))
+
+        previous = self.resourcePaths.get(name, set())
+        self.resourcePaths[name] = keys
+        #paths no longer used are dropped first, so the new ones can take their room
+        released = False
+        for key in previous - keys:
+            self.users[key] -= 1
+            if self.users[key] == 0:
+                del self.users[key]
+                self.overflow.discard(key)
+                if key in self.entries:
+                    self.dropPath(key)
+                    released = True
+        for key in keys - previous:
+            self.users[key] = self.users.get(key, 0) + 1
+            self.addPath(*key)
+        if released:
+            self.retryOverflow()
+
+    #materializes the people reached by following labels from the person named anchor
+    #returns whether the path is materialized
+    def addPath(self, anchor, labels):
+        if not labels:
+            return False
+        key = (anchor, tuple(labels))
+        if key in self.entries:
+            return True
+        if len(self.entries) >= self.maxEntries:
+            self.overflow.add(key)
+            return False
+
+        self.entries[key] = [{anchor}]
+        for edgeType in key[1]:
+            self.labelEntries.setdefault(parseEdgeType(edgeType)[0], set()).add(key)
+        self.members += 1
+        return self.walk(key, 0)
+
+    #walks the path of the entry key again from layers[start] on
+    #entries growing past maxMembers are dropped, returns whether the entry is still materialized
+    def walk(self, key, start):
+        layers = self.entries[key]
+        for layer in layers[start + 1:]:
+            self.members -= len(layer)
+        del layers[start + 1:]
+
+        labels = key[1]
+        for edgeType in labels[start:]:
+            frontier = [self.nodes[name] for name in layers[-1] if name in self.nodes]
+            layer = {node.name for node in self.socialNetwork.expand(frontier, edgeType)}
+            if self.members + len(layer) > self.maxMembers:
+                self.dropPath(key)
+                self.overflow.add(key)
+                return False
+            self.members += len(layer)
+            layers.append(layer)
+        return True
+
+    #tries again to materialize the paths left out because of the limits, or only those whose path
+    #uses label if given
+    def retryOverflow(self, label = None):
+        for key in list(self.overflow):
+            if label is not None and all(parseEdgeType(edgeType)[0] != label for edgeType in key[1]):
+                continue
+            if len(self.entries) >= self.maxEntries:
+                return
+            self.overflow.discard(key)
+            self.addPath(*key)
+
+    #forgets the entry key
+    def dropPath(self, key):
+        for layer in self.entries.pop(key):
+            self.members -= len(layer)
+        for edgeType in key[1]:
+            self.labelEntries.get(parseEdgeType(edgeType)[0], set()).discard(key)
+
+    #walks every materialized path again from scratch
+    def rebuild(self):
+        for key in list(self.entries):
+            self.walk(key, 0)
+        self.version = self.socialNetwork.version
+
+    #returns (found, reached), where reached is the set of names reached by following labels from the
+    #person named anchor if found is True. found is False if the path has to be walked live
+    def lookup(self, anchor, labels):
+        layers = self.entries.get((anchor, tuple(labels)))
+        if layers is None or self.version != self.socialNetwork.version:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, layers[-1]
+
+    #called by the social network once the edge "node1 has relationship label with node2" was added
+    def edgeAdded(self, label, node1, node2):
+        self.edgeChanged(label, node1, node2)
+
+    #called by the social network once the edge "node1 has relationship label with node2" was removed
+    #paths left out that use label may fit now
+    def edgeRemoved(self, label, node1, node2):
+        self.edgeChanged(label, node1, node2)
+        if self.overflow:
+            self.retryOverflow(label)
+
+    #walks again the entries that could have followed the changed edge, from the first layer it is
+    #followed from on
+    def edgeChanged(self, label, node1, node2):
+        stale = self.version != self.socialNetwork.version - 1
+        self.version = self.socialNetwork.version
+        if stale:
+            self.rebuild()
+            return
+
+        for key in list(self.labelEntries.get(label, ())):
+            layers = self.entries[key]
+            for i, edgeType in enumerate(key[1]):
+                edgeLabel, direction = parseEdgeType(edgeType)
+                if edgeLabel != label:
+                    continue
+                source = node1.name if direction == OUTGOING else node2.name
+                if source in layers[i]:
+                    self.updates += 1
+                    self.walk(key, i)
+                    break
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "members": self.members,
+            "overflow": len(self.overflow),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+            "updates": self.updates
+        }
+
+#returns a PathIndex of every path the policies in resources can evaluate in socialNetwork
+def buildPathIndex(resources, socialNetwork, nodes, maxEntries = 100000, maxMembers = 10000000):
+    index = PathIndex(socialNetwork, nodes, maxEntries, maxMembers)
+    index.addResources(resources)
+    return index
@@ -0,0 +1,446 @@
+#A PolicyPlan is the compiled form of a Policy used to answer access queries.
+#Statements that do not need the social network (T, a, !a) are kept in a flat list.
+#Statements with relationship paths are merged into a trie per anchor (the owner of the resource,
+#or the delegator of a Delegation), so statements sharing a prefix such as <friend>a and
+#<friend><parent>a walk the owner's friend edges only once.
+#Every node of the trie knows which permissions can be granted somewhere beneath it, so
+#branches that cannot grant the requested permission are never walked.
+#A plan can be optimized against the degree statistics of the social network (Graph.labelStatistics):
+#the branches of every trie are then ordered by their estimated cost, so cheap, low fan out paths
+#are tried before expensive ones, and statements using a label the social network has no edges of
+#are pruned. Such a statement never reaches anyone, so it never grants access unless it is negated,
+#in which case it grants access to everyone in the social network whenever its anchor is in it too.
+#An optimized plan is optimized again by itself once a pruned label could have appeared.
+#Given an AccessCache, a plan answers every statement it can from the relationship cache (shared
+#with driver.relatedVia) and only expands the frontiers leading to statements that missed it.
+
+import threading
+from statements import DelegationStatement, Delegation
+from graph import parseEdgeType
+
+#anchor key used for statements anchored at the owner of the resource
+OWNER = None
+
+#held while a plan is optimized again, so threads evaluating the same plan never see half a rebuild
+optimizeLock = threading.RLock()
+
+#the people a policy grants one permission to, as returned by PolicyPlan.grantedTo
+#members holds the people granted access by name
+#if exceptFor is not None, everyone is granted access except the people in exceptFor
+#that are not also members (T gives an empty exceptFor, !a gives the anchor)
+#unreached holds the sets of names reached by negated statements. everyone in the social network
+#(nodes) missing from one of them is granted access too, without listing them all
+class AccessSet:
+    def __init__(self, nodes = None):
+        self.members = set()
+        self.exceptFor = None
+        self.nodes = nodes
+        self.unreached = []
+
+    #records that everyone but the people in names is granted access
+    def grantAllExcept(self, names):
+        if self.exceptFor is None:
+            self.exceptFor = set(names)
+        else:
+            self.exceptFor.intersection_update(names)
+
+    #records that everyone in the social network but the people in reached is granted access
+    def grantUnreached(self, reached):
+        self.unreached.append(reached)
+
+    def __contains__(self, accessor):
+        if accessor in self.members:
+            return True
+        if self.exceptFor is not None and accessor not in self.exceptFor:
+            return True
+        if self.unreached and accessor in self.nodes:
+            for reached in self.unreached:
+                if accessor not in reached:
+                    return True
+        return False
+
+#returns a function returning compute(), calling compute only the first time it is needed
+def lazyFrontier(compute):
+    computed = []
+    def frontier():
+        if not computed:
+            computed.append(compute())
+        return computed[0]
+    return frontier
+
+#a node in a plan trie, reached by following the edge types on the way down from the anchor
+class PlanNode:
+    def __init__(self):
+        self.children = {}      #maps edge type to the PlanNode one hop further
+        self.statements = []    #relationship statements whose path ends at this node
+        self.permissions = ""   #every permission granted by a statement at or beneath this node
+        self.size = 0           #number of statements at or beneath this node
+        self.cost = 0.0         #estimated edges scanned walking everything beneath this node from one person
+
+    #records that permissions can be granted at or beneath this node
+    def addPermissions(self, permissions):
+        for c in permissions:
+            if self.permissions.find(c) == -1:
+                self.permissions = self.permissions + c
+
+#the compiled form of a policy
+#statistics = optional GraphStatistics to optimize the plan against
+class PolicyPlan:
+    def __init__(self, statements, statistics = None):
+        self.constants = []     #(anchor key, relationship statement) pairs for T, a and !a
+        self.anchored = []      #(anchor key, relationship statement) pairs for pruned negated statements
+        self.roots = {}         #maps anchor key to the root PlanNode of its trie
+        self.compiled = []      #every statement compiled into the plan, in order
+        self.statistics = statistics
+        for statement in statements:
+            self.compiled.append(statement)
+            self.compileStatement(statement)
+        self.orderTries()
+
+    #returns an independent plan of the same statements
+    def copy(self):
+        return PolicyPlan(self.compiled, self.statistics)
+
+    #compiles the plan again, optimized against the GraphStatistics statistics
+    def optimize(self, statistics):
+        plan = PolicyPlan(self.compiled, statistics)
+        with optimizeLock:
+            self.constants, self.anchored, self.roots, self.statistics = plan.constants, plan.anchored, plan.roots, statistics
+
+    #optimizes the plan again if it was optimized against a social network that may have gained a
+    #label since, or against a different social network
+    #returns the (anchored, roots) of the plan to evaluate, taken together under optimizeLock
+    def refresh(self, socialNetwork):
+        with optimizeLock:
+            if self.statistics is not None and self.statistics.labelsVersion != socialNetwork.labelsVersion:
+                self.optimize(socialNetwork.labelStatistics())
+            return self.anchored, self.roots
+
+    #compiles one more statement into the plan
+    def addStatement(self, statement):
+        self.compiled.append(statement)
+        self.compileStatement(statement)
+        self.orderTries()
+
+    #delegation statements are skipped, they are only used to validate delegations
+    def compileStatement(self, statement):
+        if type(statement) is DelegationStatement:
+            return
+        if type(statement) is Delegation:
+            anchor = statement.delegator
+            relationship = statement.relationship
+        else:
+            anchor = OWNER
+            relationship = statement
+
+        if relationship.everyone or relationship.owner:
+            self.constants.append((anchor, relationship))
+            return
+
+        if self.statistics is not None:
+            for edgeType in relationship.labels:
+                if not self.statistics.hasLabel(parseEdgeType(edgeType)[0]):
+                    if relationship.negation:
+                        self.anchored.append((anchor, relationship))
+                    return
+
+        if anchor not in self.roots:
+            self.roots[anchor] = PlanNode()
+        planNode = self.roots[anchor]
+        planNode.addPermissions(relationship.permissions)
+        planNode.size += 1
+        for edgeType in relationship.labels:
+            if edgeType not in planNode.children:
+                planNode.children[edgeType] = PlanNode()
+            planNode = planNode.children[edgeType]
+            planNode.addPermissions(relationship.permissions)
+            planNode.size += 1
+        planNode.statements.append(relationship)
+
+    #orders the anchors and the branches of every trie cheapest first, if the plan is optimized
+    def orderTries(self):
+        if self.statistics is None:
+            return
+        for root in self.roots.values():
+            self.orderTrie(root)
+        self.roots = dict(sorted(self.roots.items(), key = lambda item: item[1].cost))
+
+    #sets the cost of planNode and everything beneath it, ordering its children by their cost
+    #following an edge type costs its average fan out for every person walked, for the edge itself
+    #and again for every edge walked beneath it from the people it reaches
+    def orderTrie(self, planNode):
+        costs = {}
+        for edgeType, child in planNode.children.items():
+            self.orderTrie(child)
+            costs[edgeType] = self.statistics.fanOut(edgeType) * (1 + child.cost)
+        planNode.children = dict(sorted(planNode.children.items(), key = lambda item: costs[item[0]]))
+        planNode.cost = sum(costs.values())
+
+    #answers whether accessor has permission under this plan
+    #owner is the owner of the resource the plan belongs to
+    #stats = optional instrument.QueryStats counting the work done
+    #paths = optional paths.PathIndex, statements are then answered from it instead of walking the tries
+    #cache = optional AccessCache, whether a path relates anchor to accessor is then looked up in and
+    #recorded in cache.relationships, until the social network changes
+    def hasAccess(self, permission, owner, accessor, socialNetwork, nodes, stats = None, paths = None, cache = None):
+        for anchor, relationship in self.constants:
+            if relationship.permissions.find(permission) == -1:
+                if stats is not None:
+                    stats.statementsSkipped += 1
+                continue
+            if anchor is OWNER:
+                anchor = owner
+            if stats is not None:
+                stats.statementsEvaluated += 1
+            if relationship.everyone or relationship.negation != (anchor == accessor):
+                if stats is not None:
+                    stats.granted(relationship, anchor)
+                return True #T, a or !a
+
+        #people outside the social network are never related to anyone
+        if accessor not in nodes:
+            return False
+        accessorNode = nodes[accessor]
+
+        anchored, roots = self.refresh(socialNetwork)
+        for anchor, relationship in anchored:
+            if relationship.permissions.find(permission) == -1:
+                if stats is not None:
+                    stats.statementsSkipped += 1
+                continue
+            if anchor is OWNER:
+                anchor = owner
+            if stats is not None:
+                stats.statementsEvaluated += 1
+            if anchor in nodes:
+                if stats is not None:
+                    stats.granted(relationship, anchor)
+                return True
+
+        for anchor, root in roots.items():
+            if root.permissions.find(permission) == -1:
+                if stats is not None:
+                    stats.statementsSkipped += root.size
+                continue
+            if anchor is OWNER:
+                anchor = owner
+            if anchor not in nodes:
+                continue
+            if paths is not None:
+                if self.searchIndexed(root, (), permission, anchor, accessorNode, socialNetwork, nodes, stats, paths):
+                    return True
+            elif cache is not None:
+                frontier = lazyFrontier(lambda: socialNetwork.frontierOf(nodes[anchor]))
+                if self.searchCached(root, (), frontier, permission, anchor, accessorNode, socialNetwork, cache, stats):
+                    return True
+            elif self.searchTrie(root, socialNetwork.frontierOf(nodes[anchor]), permission, accessorNode, socialNetwork, stats, anchor):
+                return True
+        return False
+
+    #walks the trie below planNode like searchTrie, path is the edge types leading to planNode
+    #each statement is answered by looking its path up in paths, and only walked in the social network
+    #if paths has not materialized it
+    def searchIndexed(self, planNode, path, permission, anchor, accessorNode, socialNetwork, nodes, stats, paths):
+        for relationship in planNode.statements:
+            if relationship.permissions.find(permission) == -1:
+                if stats is not None:
+                    stats.statementsSkipped += 1
+                continue
+            if stats is not None:
+                stats.statementsEvaluated += 1
+            found, reached = paths.lookup(anchor, path)
+            if found:
+                related = accessorNode.name in reached
+            else:
+                related = socialNetwork.hasRelationshipFrontier(path, nodes[anchor], accessorNode, stats)
+            if related != relationship.negation:
+                if stats is not None:
+                    stats.granted(relationship, anchor)
+                return True
+
+        for edgeType, child in planNode.children.items():
+            if child.permissions.find(permission) == -1:
+                if stats is not None:
+                    stats.statementsSkipped += child.size
+                continue
+            if self.searchIndexed(child, path + (edgeType,), permission, anchor, accessorNode, socialNetwork, nodes, stats, paths):
+                return True
+        return False
+
+    #walks the trie below planNode like searchTrie, path is the edge types leading to planNode and
+    #frontier a lazyFrontier of the people it reaches
+    #each statement is answered from cache.relationships if it can be, so frontiers are only expanded
+    #down to statements that missed the cache, and their answers are recorded there
+    def searchCached(self, planNode, path, frontier, permission, anchor, accessorNode, socialNetwork, cache, stats = None):
+        for relationship in planNode.statements:
+            if relationship.permissions.find(permission) == -1:
+                if stats is not None:
+                    stats.statementsSkipped += 1
+                continue
+            if stats is not None:
+                stats.statementsEvaluated += 1
+            #same key as relatedVia, so compiled and uncompiled evaluation share entries
+            key = (path, anchor, accessorNode.name)
+            found, related = cache.relationships.get(key, socialNetwork.version)
+            if not found:
+                related = socialNetwork.inFrontier(frontier(), accessorNode)
+                cache.relationships.put(key, socialNetwork.version, related)
+            if related != relationship.negation:
+                if stats is not None:
+                    stats.granted(relationship, anchor)
+                return True
+
+        for edgeType, child in planNode.children.items():
+            if child.permissions.find(permission) == -1:
+                if stats is not None:
+                    stats.statementsSkipped += child.size
+                continue
+            reached = lazyFrontier(lambda edgeType = edgeType: socialNetwork.expandFrontier(frontier(), edgeType, stats, len(path) + 1))
+            if self.searchCached(child, path + (edgeType,), reached, permission, anchor, accessorNode, socialNetwork, cache, stats):
+                return True
+        return False
+
+    #walks the trie below planNode, frontier holds the people reached by the path leading to planNode
+    #in the form socialNetwork walks paths with (see Graph.frontierOf)
+    #returns True as soon as a statement grants permission to accessorNode
+    #stats and anchor are only used for instrumentation, depth is the number of hops down to planNode
+    def searchTrie(self, planNode, frontier, permission, accessorNode, socialNetwork, stats = None, anchor = None, depth = 0):
+        for relationship in planNode.statements:
+            if relationship.permissions.find(permission) == -1:
+                if stats is not None:
+                    stats.statementsSkipped += 1
+                continue
+            if stats is not None:
+                stats.statementsEvaluated += 1
+            #a statement grants access if the accessor was reached, or was not reached for negated statements
+            if socialNetwork.inFrontier(frontier, accessorNode) != relationship.negation:
+                if stats is not None:
+                    stats.granted(relationship, anchor)
+                return True
+
+        for edgeType, child in planNode.children.items():
+            if child.permissions.find(permission) == -1:
+                if stats is not None:
+                    stats.statementsSkipped += child.size
+                continue
+            reached = socialNetwork.expandFrontier(frontier, edgeType, stats, depth + 1)
+            if self.searchTrie(child, reached, permission, accessorNode, socialNetwork, stats, anchor, depth + 1):
+                return True
+        return False
+
+    #answers hasAccess for every accessor in accessors at once, returns a dict mapping each accessor to
+    #whether they have permission under this plan
+    #the tries are walked once for all of them, and the walk stops as soon as all of them are granted access
+    def hasAccessAll(self, permission, owner, accessors, socialNetwork, nodes):
+        decisions = dict.fromkeys(accessors, False)
+        pending = set(decisions)
+        for anchor, relationship in self.constants:
+            if relationship.permissions.find(permission) == -1:
+                continue
+            if anchor is OWNER:
+                anchor = owner
+            for accessor in list(pending):
+                if relationship.everyone or relationship.negation != (anchor == accessor):
+                    decisions[accessor] = True #T, a or !a
+                    pending.discard(accessor)
+
+        #people outside the social network are never related to anyone
+        pending = {nodes[accessor] for accessor in pending if accessor in nodes}
+        if not pending:
+            return decisions
+
+        anchored, roots = self.refresh(socialNetwork)
+        for anchor, relationship in anchored:
+            if relationship.permissions.find(permission) == -1:
+                continue
+            if anchor is OWNER:
+                anchor = owner
+            if anchor in nodes:
+                for accessorNode in pending:
+                    decisions[accessorNode.name] = True
+                return decisions
+
+        for anchor, root in roots.items():
+            if root.permissions.find(permission) == -1:
+                continue
+            if anchor is OWNER:
+                anchor = owner
+            if anchor not in nodes:
+                continue
+            self.searchTrieAll(root, socialNetwork.frontierOf(nodes[anchor]), permission, pending, decisions, socialNetwork)
+            if not pending:
+                break
+        return decisions
+
+    #walks the trie below planNode like searchTrie, for every accessor node in pending at once
+    #accessors granted access are marked in decisions and removed from pending
+    def searchTrieAll(self, planNode, frontier, permission, pending, decisions, socialNetwork):
+        for relationship in planNode.statements:
+            if relationship.permissions.find(permission) == -1:
+                continue
+            for accessorNode in list(pending):
+                if socialNetwork.inFrontier(frontier, accessorNode) != relationship.negation:
+                    decisions[accessorNode.name] = True
+                    pending.discard(accessorNode)
+            if not pending:
+                return
+
+        for edgeType, child in planNode.children.items():
+            if child.permissions.find(permission) == -1:
+                continue
+            self.searchTrieAll(child, socialNetwork.expandFrontier(frontier, edgeType), permission, pending, decisions, socialNetwork)
+            if not pending:
+                return
+
+    #returns an AccessSet of everyone granted permission under this plan
+    #each trie is walked once from its anchor, materializing the full set of people reached,
+    #so any number of accessors can then be checked against the result
+    def grantedTo(self, permission, owner, socialNetwork, nodes):
+        granted = AccessSet(nodes)
+        for anchor, relationship in self.constants:
+            if relationship.permissions.find(permission) == -1:
+                continue
+            if anchor is OWNER:
+                anchor = owner
+            if relationship.everyone:
+                granted.grantAllExcept([]) #T
+            elif relationship.negation:
+                granted.grantAllExcept([anchor]) #!a
+            else:
+                granted.members.add(anchor) #a
+
+        anchored, roots = self.refresh(socialNetwork)
+        for anchor, relationship in anchored:
+            if relationship.permissions.find(permission) == -1:
+                continue
+            if anchor is OWNER:
+                anchor = owner
+            if anchor in nodes:
+                granted.grantUnreached(frozenset())
+
+        for anchor, root in roots.items():
+            if root.permissions.find(permission) == -1:
+                continue
+            if anchor is OWNER:
+                anchor = owner
+            if anchor not in nodes:
+                continue
+            self.collectTrie(root, socialNetwork.frontierOf(nodes[anchor]), permission, granted, socialNetwork)
+        return granted
+
+    #walks the trie below planNode, recording everyone granted permission in the AccessSet granted
+    def collectTrie(self, planNode, frontier, permission, granted, socialNetwork):
+        for relationship in planNode.statements:
+            if relationship.permissions.find(permission) == -1:
+                continue
+            reached = socialNetwork.frontierNames(frontier)
+            if relationship.negation:
+                #everyone in the social network who was not reached
+                granted.grantUnreached(reached)
+            else:
+                granted.members.update(reached)
+
+        for edgeType, child in planNode.children.items():
+            if child.permissions.find(permission) == -1:
+                continue
+            self.collectTrie(child, socialNetwork.expandFrontier(frontier, edgeType), permission, granted, socialNetwork)
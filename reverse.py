@@ -0,0 +1,115 @@
+#A ResourceIndex answers "which resources can this person access?" without checking every
+#resource one at a time. Statements of every policy are indexed by the person they are anchored
+#at (the owner of the resource, or the delegator of a Delegation).
+#Relationship paths are stored reversed in a trie shared by all resources: walking the trie from
+#the accessor, with every edge type reversed, reaches exactly the anchors the accessor is related
+#to, so a single walk matches the accessor against every resource at once.
+#T, a and !a statements do not need the social network and are kept in precomputed lists.
+
+from statements import DelegationStatement, Delegation
+from graph import reverseEdgeType
+
+#a node in the reversed path trie
+class ReverseNode:
+    def __init__(self):
+        self.children = {}      #maps reversed edge type to the ReverseNode one hop further
+        self.anchored = {}      #maps anchor name to (resource, statement) pairs whose path ends here
+        self.negated = []       #(resource, anchor, statement) for negated statements whose path ends here
+
+#the index of every statement in resources, see above
+class ResourceIndex:
+    def __init__(self, resources):
+        self.everyone = []      #(resource, statement) pairs for T
+        self.anchors = {}       #maps anchor name to (resource, statement) pairs for a
+        self.notAnchors = []    #(resource, anchor, statement) for !a
+        self.root = ReverseNode()
+        self.versions = {}      #maps resource to the (policy version, owner) that was indexed
+
+        for resource in resources:
+            owner = resources[resource]["owner"]
+            policy = resources[resource]["policy"]
+            self.versions[resource] = (policy.version, owner)
+            for statement in policy.statements:
+                if type(statement) is DelegationStatement:
+                    continue
+                if type(statement) is Delegation:
+                    self.addStatement(resource, statement.delegator, statement.relationship)
+                else:
+                    self.addStatement(resource, owner, statement)
+
+    #indexes statement of resource's policy, anchored at the person named anchor
+    def addStatement(self, resource, anchor, statement):
+        if statement.everyone:
+            self.everyone.append((resource, statement))
+            return
+        if statement.owner and statement.negation:
+            self.notAnchors.append((resource, anchor, statement))
+            return
+        if statement.owner:
+            self.anchors.setdefault(anchor, []).append((resource, statement))
+            return
+
+        reverseNode = self.root
+        for edgeType in reversed(statement.labels):
+            edgeType = reverseEdgeType(edgeType)
+            if edgeType not in reverseNode.children:
+                reverseNode.children[edgeType] = ReverseNode()
+            reverseNode = reverseNode.children[edgeType]
+        if statement.negation:
+            reverseNode.negated.append((resource, anchor, statement))
+        else:
+            reverseNode.anchored.setdefault(anchor, []).append((resource, statement))
+
+    #whether the index still matches resources, i.e. no policy or owner has changed since it was built
+    def isCurrent(self, resources):
+        if len(resources) != len(self.versions):
+            return False
+        for resource in resources:
+            version = (resources[resource]["policy"].version, resources[resource]["owner"])
+            if self.versions.get(resource) != version:
+                return False
+        return True
+
+    #returns a dict mapping every resource accessor can access to the permissions they are granted
+    def accessibleResources(self, accessor, socialNetwork, nodes):
+        granted = {}
+        for resource, statement in self.everyone:
+            grant(granted, resource, statement.permissions) #T
+        for resource, statement in self.anchors.get(accessor, []):
+            grant(granted, resource, statement.permissions) #a
+        for resource, anchor, statement in self.notAnchors:
+            if anchor != accessor:
+                grant(granted, resource, statement.permissions) #!a
+
+        #people outside the social network are never related to anyone
+        if accessor in nodes:
+            self.collectTrie(self.root, {nodes[accessor]}, granted, socialNetwork, nodes)
+        return granted
+
+    #walks the trie below reverseNode, frontier holds the people that can reach the accessor
+    #through the path leading to reverseNode
+    def collectTrie(self, reverseNode, frontier, granted, socialNetwork, nodes):
+        if reverseNode.anchored or reverseNode.negated:
+            reached = {node.name for node in frontier}
+            #look anchors up from whichever side is smaller
+            if len(reached) < len(reverseNode.anchored):
+                anchors = [anchor for anchor in reached if anchor in reverseNode.anchored]
+            else:
+                anchors = [anchor for anchor in reverseNode.anchored if anchor in reached]
+            for anchor in anchors:
+                for resource, statement in reverseNode.anchored[anchor]:
+                    grant(granted, resource, statement.permissions)
+            for resource, anchor, statement in reverseNode.negated:
+                if anchor in nodes and anchor not in reached:
+                    grant(granted, resource, statement.permissions)
+
+        for edgeType, child in reverseNode.children.items():
+            self.collectTrie(child, socialNetwork.expand(frontier, edgeType), granted, socialNetwork, nodes)
+
+#adds permissions to the permissions granted for resource
+def grant(granted, resource, permissions):
+    current = granted.get(resource, "")
+    for c in permissions:
+        if current.find(c) == -1:
+            current = current + c
+    granted[resource] = current
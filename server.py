@@ -0,0 +1,155 @@
+#An asyncio decision server answering access queries over a local TCP or unix socket.
+#
+#The protocol is newline delimited JSON. Each request line is an object
+#   {"id": <any>, "resource": "file.txt", "accessor": "Marie", "permission": "read"}
+#where permission is a permission name or character, and is answered with one line
+#   {"id": <same id>, "granted": true}  or  {"id": <same id>, "error": "..."}
+#Requests can be pipelined: a client may send any number of requests without waiting, and
+#responses are written as soon as they are ready, so they are matched to requests by id.
+#
+#Queries arriving within batchWindow seconds of each other for the same resource are answered
+#together, sharing one evaluation of the resource's policy (see driver.decideQueries). Evaluation
+#runs on a pool of worker processes (or a background thread), so the event loop stays free to
+#read and write sockets while policies are being evaluated.
+
+import asyncio, json
+from concurrent.futures import ThreadPoolExecutor
+from driver import decideQueries, permissionCharacters
+import parallel
+
+#answers queries, a list of (accessor, permission character), for resource against the worker's state
+def evaluateQueries(resource, queries):
+    resources, socialNetwork, nodes, permissions = parallel.sharedState
+    return decideQueries(resource, queries, socialNetwork, resources, nodes)
+
+class DecisionServer:
+    #workers = number of worker processes evaluating queries (threads for a PartitionedGraph), 0 to evaluate on one background thread
+    #source = (filename, snapshot, edgeFile) the state was preprocessed from, for workers that cannot be forked
+    #batchWindow = seconds to wait for more queries for the same resource before evaluating a batch
+    #maxBatch = number of queries that is evaluated straight away, without waiting for batchWindow
+    def __init__(self, permissions, socialNetwork, nodes, resources, workers = 0, source = None, batchWindow = 0.001, maxBatch = 1024):
+        self.permissions = permissions
+        self.permissionChars = permissionCharacters(permissions)
+        self.resources = resources
+        self.state = (resources, socialNetwork, nodes, permissions)
+        self.workers = workers
+        self.source = source
+        self.batchWindow = batchWindow
+        self.maxBatch = maxBatch
+        self.pending = {}       #maps resource to the (accessor, permission, future) waiting to be evaluated
+        self.pool = None
+
+    #starts the worker pool, if it has not been started yet
+    def startPool(self):
+        if self.pool is not None:
+            return
+        if self.workers == 0:
+            parallel.setSharedState(self.state)
+            self.pool = ThreadPoolExecutor(max_workers = 1)
+        else:
+            self.pool = parallel.sharedStatePool(self.state, self.workers, self.source)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    #listens on host and port, or on the unix socket path if given, until cancelled
+    async def serve(self, host = "127.0.0.1", port = 8765, path = None):
+        self.startPool()
+        try:
+            if path is not None:
+                server = await asyncio.start_unix_server(self.handleConnection, path = path)
+            else:
+                server = await asyncio.start_server(self.handleConnection, host, port)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    #reads requests from one client, answering each as soon as it is ready
+    async def handleConnection(self, reader, writer):
+        answering = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self.answer(line, writer))
+                answering.add(task)
+                task.add_done_callback(answering.discard)
+            if answering:
+                await asyncio.gather(*answering)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def answer(self, line, writer):
+        response = await self.respond(line)
+        writer.write((json.dumps(response) + "\n").encode("utf-8"))
+        await writer.drain()
+
+    #returns the response to one request line
+    async def respond(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {"id": None, "error": "Invalid request: {}".format(e)}
+        if type(request) is not dict:
+            return {"id": None, "error": "Invalid request: requests must be JSON objects"}
+
+        id = request.get("id")
+        resource = request.get("resource")
+        accessor = request.get("accessor")
+        permission = request.get("permission")
+        #checked first, since lists and objects cannot be looked up in resources or permissions
+        if not all(type(field) is str for field in (resource, accessor, permission)):
+            return {"id": id, "error": "Invalid request: resource, accessor and permission must be strings"}
+        if resource not in self.resources:
+            return {"id": id, "error": "{} is not an existing resource".format(resource)}
+        if permission in self.permissionChars:
+            permission = self.permissionChars[permission]
+        elif permission not in self.permissions:
+            return {"id": id, "error": "{} is not an existing permission".format(permission)}
+
+        try:
+            granted = await self.submit(resource, accessor, permission)
+        except Exception as e:
+            return {"id": id, "error": "Error evaluating query: {}".format(e)}
+        return {"id": id, "granted": granted}
+
+    #queues a query for resource, returns a future for its answer
+    def submit(self, resource, accessor, permission):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if resource not in self.pending:
+            self.pending[resource] = []
+            loop.call_later(self.batchWindow, self.flush, resource)
+        batch = self.pending[resource]
+        batch.append((accessor, permission, future))
+        if len(batch) >= self.maxBatch:
+            self.flush(resource)
+        return future
+
+    #sends the queries waiting for resource to be evaluated
+    def flush(self, resource):
+        batch = self.pending.pop(resource, None)
+        if batch:
+            asyncio.ensure_future(self.evaluate(resource, batch))
+
+    async def evaluate(self, resource, batch):
+        queries = [(accessor, permission) for accessor, permission, future in batch]
+        loop = asyncio.get_running_loop()
+        try:
+            decisions = await loop.run_in_executor(self.pool, evaluateQueries, resource, queries)
+        except Exception as e:
+            for accessor, permission, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (accessor, permission, future), granted in zip(batch, decisions):
+            if not future.done():
+                future.set_result(granted)
@@ -0,0 +1,164 @@
+#Binary snapshots of the preprocessed state of a policy file, so later runs can skip reading the
+#JSON, parsing policy strings, building the social network from "A, B" strings and validating
+#delegations.
+#
+#Layout of a snapshot file (header fields little endian):
+#   magic           8 bytes, SNAPSHOT_MAGIC
+#   format version  uint32, SNAPSHOT_VERSION
+#   source hash     32 bytes, sha256 of the policy file the snapshot was made from
+#   metadata length uint64
+#   edge count      uint64
+#   metadata        JSON: interned name and label tables, permissions, and every resource with
+#                   its compiled statements and validated delegations
+#   padding         up to a multiple of 4 bytes
+#   edges           three int32 arrays of edge count entries: label ids, left ids, right ids
+#
+#Snapshots are read through mmap and the edge arrays are handed to the graph as views of the file,
+#without decoding them first. A CSRGraph copies each array in one block (see CSRGraph.loadEdges),
+#other graphs add the edges one at a time, so nothing refers to the file once loadSnapshot returns.
+#A snapshot made from a different version of the policy file (or by a different snapshot format,
+#or on a machine of different byte order) is stale, and loadSnapshot returns None for it.
+
+import hashlib, json, mmap, os, struct, sys
+from array import array
+from statements import DelegationStatement, Delegation, Policy, internStatement, internDelegationStatement
+from plan import PolicyPlan
+from graph import Node
+
+SNAPSHOT_MAGIC = b"PLCYSNAP"
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct("<8sI32sQQ")
+
+#returns the sha256 digest of the contents of the given files, one after the other
+def hashFile(*filenames):
+    digest = hashlib.sha256()
+    for filename in filenames:
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.digest()
+
+#writes the preprocessed state of a policy file to path
+#sourceHash is hashFile of the policy file the state was preprocessed from
+def writeSnapshot(path, sourceHash, permissions, socialNetwork, nodes, resources):
+    names = list(nodes)
+    ids = {name: i for i, name in enumerate(names)}
+    labels = []
+    labelIds = {}
+    edgeLabels = array("i")
+    edgeLefts = array("i")
+    edgeRights = array("i")
+    for label, left, right in socialNetwork.edgeList():
+        if label not in labelIds:
+            labelIds[label] = len(labels)
+            labels.append(label)
+        edgeLabels.append(labelIds[label])
+        edgeLefts.append(ids[left.name])
+        edgeRights.append(ids[right.name])
+
+    savedResources = {}
+    for resource in resources:
+        entry = dict(resources[resource])
+        entry["policy"] = [encodeStatement(statement) for statement in resources[resource]["policy"].statements]
+        savedResources[resource] = entry
+
+    metadata = json.dumps({
+        "byteorder": sys.byteorder,
+        "names": names,
+        "labels": labels,
+        "permissions": permissions,
+        "resources": savedResources
+    }).encode("utf-8")
+    padding = b"\0" * (-(HEADER.size + len(metadata)) % 4)
+
+    #write to a temporary file first so a half written snapshot is never picked up
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sourceHash, len(metadata), len(edgeLabels)))
+        f.write(metadata)
+        f.write(padding)
+        for edges in (edgeLabels, edgeLefts, edgeRights):
+            edges.tofile(f)
+    os.replace(temporary, path)
+
+#loads the snapshot at path into socialNetwork, an empty Graph or CSRGraph
+#returns permissions, socialNetwork, nodes, resources as preprocess does,
+#or None if there is no snapshot at path or it is stale
+def loadSnapshot(path, sourceHash, socialNetwork):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            return None
+        contents = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    try:
+        magic, version, savedHash, metadataLength, edgeCount = HEADER.unpack_from(contents, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or savedHash != sourceHash:
+            return None
+        offset = HEADER.size
+        metadata = json.loads(bytes(contents[offset:offset + metadataLength]).decode("utf-8"))
+        if metadata["byteorder"] != sys.byteorder:
+            return None
+        offset = offset + metadataLength
+        offset = offset + (-offset % 4)
+
+        view = memoryview(contents)
+        arrays = []
+        for i in range(3):
+            start = offset + i * edgeCount * 4
+            arrays.append(view[start:start + edgeCount * 4].cast("i"))
+        nodes = loadEdges(socialNetwork, metadata["names"], metadata["labels"], *arrays)
+        for edges in arrays:
+            edges.release()
+        view.release()
+    finally:
+        contents.close()
+
+    #resources with the same policy share its statements and plan, as they do after processPolicy
+    templates = {}      #maps the tuple of a policy's own (interned) statements to its template Policy
+    resources = metadata["resources"]
+    for resource in resources:
+        statements = [decodeStatement(encoded) for encoded in resources[resource]["policy"]]
+        own = tuple(statement for statement in statements if type(statement) is not Delegation)
+        template = templates.get(own)
+        if template is None:
+            template = Policy(list(own))
+            template.plan = PolicyPlan(template.statements)
+            templates[own] = template
+        policy = Policy(template.statements)
+        policy.plan = template.plan
+        policy.shared = True
+        for statement in statements:
+            if type(statement) is Delegation:
+                policy.addDelegation(statement)
+        resources[resource]["policy"] = policy
+    return metadata["permissions"], socialNetwork, nodes, resources
+
+#adds the edges held in the flat id arrays to socialNetwork, returns the nodes dict
+def loadEdges(socialNetwork, names, labels, edgeLabels, edgeLefts, edgeRights):
+    if hasattr(socialNetwork, "loadEdges"):
+        return socialNetwork.loadEdges(names, labels, edgeLabels, edgeLefts, edgeRights)
+
+    people = [Node(name) for name in names]
+    for i in range(len(edgeLabels)):
+        socialNetwork.addEdge(labels[edgeLabels[i]], people[edgeLefts[i]], people[edgeRights[i]])
+    return {person.name: person for person in people}
+
+#returns a JSON friendly list representing a RelationshipStatement, DelegationStatement or Delegation
+def encodeStatement(statement):
+    if type(statement) is DelegationStatement:
+        return ["delegationStatement"] + encodeRelationship(statement.relationship)
+    if type(statement) is Delegation:
+        return ["delegation", statement.delegator] + encodeRelationship(statement.relationship)
+    return ["relationship"] + encodeRelationship(statement)
+
+def encodeRelationship(relationship):
+    return [relationship.owner, relationship.everyone, relationship.negation, relationship.labels, relationship.permissions]
+
+#inverse of encodeStatement, statements are interned as they are when parsing a policy
+def decodeStatement(encoded):
+    if encoded[0] == "delegationStatement":
+        return internDelegationStatement(internStatement(*encoded[1:]))
+    if encoded[0] == "delegation":
+        return Delegation(internStatement(*encoded[2:]), encoded[1])
+    return internStatement(*encoded[1:])
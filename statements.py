@@ -11,10 +11,18 @@
 #When actually deciding access, only the RelationshipStatement and Delegation objects
 #are consulted. After processDelegations, the Delegation objects in the policy are ignored.
 
+import itertools, sys, weakref
+
+#every change to any policy draws a new number from here, so a policy's version never repeats,
+#even across different Policy objects. used to tell when cached decisions have gone stale
+policyVersions = itertools.count()
+
 
 #to represent the processed form of a relationship statement from the policy file
 #Ex. processed form of <friend><parent>a(rwx)
 class RelationshipStatement:
+    __slots__ = ("owner", "everyone", "negation", "labels", "permissions", "__weakref__")
+
     #owner =boolean, whether or not relationship is either "a" or "!a"
     #everyone = boolean, whether or not relationship is "T"
     #negation = boolean, whether or not relationship begins with !
@@ -28,6 +36,20 @@ class RelationshipStatement:
         self.labels = labels
         self.permissions = permissions
 
+    #returns the statement written as it would be in a policy file, e.g. !<friend><-parent>a(rw)
+    #target is the letter the path ends with, a for statements and d for delegations
+    def describe(self, target = "a"):
+        if self.everyone:
+            statement = "T"
+        else:
+            statement = "!" if self.negation else ""
+            for label in self.labels or ():
+                statement = statement + "<{}>".format(label)
+            statement = statement + target
+        if self.permissions is not None:
+            statement = statement + "({})".format(self.permissions)
+        return statement
+
     def printStatement(self):
         print("Owner: {}".format(self.owner))
         print("Everyone: {}".format(self.everyone))
@@ -40,9 +62,37 @@ class RelationshipStatement:
         if(self.permissions != None):
             print("Permissions: {}".format(self.permissions))
 
+#interned RelationshipStatement objects, keyed by (owner, everyone, negation, labels, permissions)
+#statements are never modified after parsing, so every identical statement in every policy is
+#represented by the same object. statements are only held here while some policy still uses them
+internedStatements = weakref.WeakValueDictionary()
+
+#returns the interned RelationshipStatement with the given fields, labels given as a sequence of strings
+def internStatement(owner, everyone, negation, labels = None, permissions = None):
+    if labels is not None:
+        labels = tuple(sys.intern(label) for label in labels)
+    key = (owner, everyone, negation, labels, permissions)
+    statement = internedStatements.get(key)
+    if statement is None:
+        statement = RelationshipStatement(owner, everyone, negation, labels, permissions)
+        internedStatements[key] = statement
+    return statement
+
+#interned DelegationStatement objects, keyed by the interned RelationshipStatement they wrap
+internedDelegationStatements = weakref.WeakValueDictionary()
+
+def internDelegationStatement(relationship):
+    statement = internedDelegationStatements.get(relationship)
+    if statement is None:
+        statement = DelegationStatement(relationship)
+        internedDelegationStatements[relationship] = statement
+    return statement
+
 #to represent to processed form of a delegation statement
 #to represent processed form of $(<parent>a)
 class DelegationStatement:
+    __slots__ = ("relationship", "__weakref__")
+
     def __init__(self, relationship):
         if not isinstance(relationship, RelationshipStatement):
             raise TypeError("Delegation class constructor must be given a RelationshipStatement")
@@ -54,6 +104,8 @@ class DelegationStatement:
 #to represent the processed form of a delegation from the delegations in the policy file
 # e.g. the processed form of "<friend><friend>d"
 class Delegation:
+    __slots__ = ("relationship", "delegator")
+
     def __init__(self, relationship, delegator):
         self.relationship = relationship
         self.delegator = delegator
@@ -69,6 +121,24 @@ class Policy:
             if not (isinstance(statement, RelationshipStatement) or isinstance(statement, DelegationStatement) or isinstance(statement, Delegation)):
                 raise TypeError("Policy class constructor must be passed an array of RelationshipStatement, DelegationStatement, and Delegation")
         self.statements = statements
+        self.plan = None        #compiled PolicyPlan, set during preprocessing
+        self.version = next(policyVersions)
+        self.shared = False     #whether statements and plan are shared with other policies parsed from
+                                #the same policy string, they are copied before this policy changes
+
+    #appends a validated Delegation to the policy, keeping the compiled plan up to date
+    def addDelegation(self, delegation):
+        if not isinstance(delegation, Delegation):
+            raise TypeError("addDelegation method in class Policy must be passed a Delegation")
+        if self.shared:
+            self.statements = list(self.statements)
+            if self.plan is not None:
+                self.plan = self.plan.copy()
+            self.shared = False
+        self.statements.append(delegation)
+        self.version = next(policyVersions)
+        if self.plan is not None:
+            self.plan.addStatement(delegation)
 
     def printPolicy(self):
         for statement in self.statements:
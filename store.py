@@ -0,0 +1,171 @@
+#A PolicyStore keeps the preprocessed state of a policy file (permissions, social network,
+#nodes and resources) alive and applies changes to it one at a time, instead of running
+#preprocess over the whole file again.
+#Each change only redoes the work for what it touches:
+#   -relationship changes update the graph, then re-check the delegations of resources whose
+#    statements use the relationship's label. removing someone's last relationship also removes
+#    them from nodes, which changes the result of every negated path statement anchored at them,
+#    so the delegations of resources with negated path statements are re-checked as well
+#   -policy changes re-parse that resource's policy and re-check its delegations
+#   -revoking a delegation re-checks only the delegations of that resource made after it, since
+#    only those could have been validated using permissions it granted
+#Delegations that are no longer valid after a change are dropped rather than raising an error,
+#and every method that can drop delegations returns the (resource, delegator) pairs it dropped.
+
+from statements import RelationshipStatement, Delegation
+from graph import parseEdgeType
+from driver import preprocess, processPolicy, compilePolicy, optimizePlans, validateDelegation, addRelationship, hasAccess
+
+#paths = optional paths.PathIndex of the social network to answer queries with. the paths of new
+#policies and delegations are added to it as they are made
+class PolicyStore:
+    def __init__(self, permissions, socialNetwork, nodes, resources, paths = None):
+        self.permissions = permissions
+        self.socialNetwork = socialNetwork
+        self.nodes = nodes
+        self.resources = resources
+        self.paths = paths
+        self.labelResources = {}    #maps label to the resources with delegations whose statements use it
+        self.negatedResources = set()   #resources with delegations and a negated statement with labels
+        for resource in resources:
+            self.indexLabels(resource)
+
+    #adds the relationship "left has relationship label with right"
+    def addRelationship(self, label, left, right):
+        addRelationship(self.socialNetwork, self.nodes, label, left, right)
+        return self.relationshipChanged(label)
+
+    #removes the relationship "left has relationship label with right"
+    #people left without any relationships are removed from the social network
+    def removeRelationship(self, label, left, right):
+        if left not in self.nodes or right not in self.nodes:
+            raise ValueError("No {} relationship from {} to {}".format(label, left, right))
+        if not self.socialNetwork.removeEdge(label, self.nodes[left], self.nodes[right]):
+            raise ValueError("No {} relationship from {} to {}".format(label, left, right))
+
+        removedNode = False
+        for name in (left, right):
+            if name in self.nodes and not self.socialNetwork.hasNode(self.nodes[name]):
+                del self.nodes[name]
+                removedNode = True
+        return self.relationshipChanged(label, removedNode)
+
+    #replaces the policy of resource with the policy string policy
+    #a new resource is created if it does not exist yet, in which case owner must be given
+    def setPolicy(self, resource, policy, owner = None):
+        newPolicy = processPolicy(policy)
+        if resource not in self.resources:
+            if owner is None:
+                raise ValueError("An owner must be given for new resource {}".format(resource))
+            self.resources[resource] = {"owner": owner, "policy": newPolicy, "delegations": {}}
+            optimizePlans({resource: self.resources[resource]}, self.socialNetwork)
+            self.indexLabels(resource)
+            return []
+
+        if owner is not None:
+            self.resources[resource]["owner"] = owner
+        self.resources[resource]["policy"] = newPolicy
+        return self.revalidate(resource, 0)
+
+    #adds the delegation "delegator delegates delegates for resource", e.g. delegates = "<friend>d(r)"
+    #raises SyntaxError, leaving the resource unchanged, if the delegation is invalid
+    def addDelegation(self, resource, delegator, delegates):
+        if "delegations" not in self.resources[resource]:
+            self.resources[resource]["delegations"] = {}
+        delegations = self.resources[resource]["delegations"]
+        if delegator in delegations:
+            raise ValueError("{} already delegates for resource {}, revoke it first".format(delegator, resource))
+
+        delegations[delegator] = {"delegates": delegates}
+        try:
+            delegation = validateDelegation(resource, delegator, self.resources, self.socialNetwork, self.nodes, self.permissions)
+        except SyntaxError:
+            del delegations[delegator]
+            raise
+        self.resources[resource]["policy"].addDelegation(delegation)
+        self.indexLabels(resource)
+
+    #revokes the delegation made by delegator for resource
+    def revokeDelegation(self, resource, delegator):
+        delegations = self.resources[resource].get("delegations", {})
+        if delegator not in delegations:
+            raise ValueError("{} does not delegate for resource {}".format(delegator, resource))
+        position = list(delegations).index(delegator)
+        del delegations[delegator]
+        return self.revalidate(resource, position)
+
+    #answers hasAccess against the current state of the store
+    def hasAccess(self, resource, accessor, permission, cache = None):
+        return hasAccess(resource, accessor, permission, self.socialNetwork, self.resources, self.nodes, cache = cache, paths = self.paths)
+
+    #re-checks the delegations of every resource that could be affected by a change to label
+    #removedNode = whether someone was removed from nodes by the change
+    def relationshipChanged(self, label, removedNode = False):
+        affected = set(self.labelResources.get(label, ()))
+        if removedNode:
+            affected |= self.negatedResources
+        dropped = []
+        for resource in affected:
+            dropped.extend(self.revalidate(resource, 0))
+        return dropped
+
+    #rebuilds the policy of resource from its own statements, keeps its first start delegations
+    #as they are and validates the rest again in order, dropping any that are no longer valid
+    def revalidate(self, resource, start):
+        delegations = self.resources[resource].get("delegations", {})
+        delegators = list(delegations)
+        policy = self.resources[resource]["policy"]
+
+        kept = {}
+        statements = []
+        for statement in policy.statements:
+            if type(statement) is Delegation:
+                if statement.delegator in delegators[:start]:
+                    kept[statement.delegator] = statement
+            else:
+                statements.append(statement)
+
+        newPolicy = compilePolicy(statements)
+        self.resources[resource]["policy"] = newPolicy
+        optimizePlans({resource: self.resources[resource]}, self.socialNetwork)
+        for delegator in delegators[:start]:
+            newPolicy.addDelegation(kept[delegator])
+
+        dropped = []
+        for delegator in delegators[start:]:
+            try:
+                delegation = validateDelegation(resource, delegator, self.resources, self.socialNetwork, self.nodes, self.permissions)
+            except SyntaxError:
+                del delegations[delegator]
+                dropped.append((resource, delegator))
+                continue
+            newPolicy.addDelegation(delegation)
+
+        self.indexLabels(resource)
+        return dropped
+
+    #records which labels the statements of resource use, if it has delegations that may need re-checking
+    #and materializes the paths of its statements if the store has a PathIndex
+    def indexLabels(self, resource):
+        if self.paths is not None:
+            self.paths.addResource(resource, self.resources[resource])
+        for resources in self.labelResources.values():
+            resources.discard(resource)
+        self.negatedResources.discard(resource)
+        if not self.resources[resource].get("delegations"):
+            return
+
+        for statement in self.resources[resource]["policy"].statements:
+            relationship = statement
+            if type(statement) is not RelationshipStatement:
+                relationship = statement.relationship
+            if relationship.negation and relationship.labels:
+                self.negatedResources.add(resource)
+            for edgeType in relationship.labels or ():
+                label = parseEdgeType(edgeType)[0]
+                self.labelResources.setdefault(label, set()).add(resource)
+
+#returns a PolicyStore holding the preprocessed contents of the policy file filename
+def loadPolicyStore(filename):
+    permissions, socialNetwork, nodes, resources = preprocess(filename)
+    return PolicyStore(permissions, socialNetwork, nodes, resources)
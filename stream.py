@@ -0,0 +1,241 @@
+#Streaming ingestion of policy files too large to load with json.load.
+#The "relationships" section is parsed incrementally, one relationship string at a time, and every
+#relationship is added to the social network as soon as it is read, so neither the JSON text nor
+#the relationship strings are ever held in memory all at once. The other sections of the policy
+#file ("resources" and "permission types") are small and are decoded whole.
+#Relationships can also be given in a sidecar edge list file, one relationship per line written
+#as <label>\t<left>\t<right>, in which case the policy file does not need a "relationships" section.
+
+import json, re, sys, time
+from driver import addRelationship, addRelationshipString
+
+#characters that end a run of string contents
+STRING_BREAK = re.compile(r'["\\]')
+
+#reads JSON text from a file in chunks of chunkSize characters
+class JSONStream:
+    def __init__(self, file, chunkSize = 1 << 16):
+        self.file = file
+        self.chunkSize = chunkSize
+        self.buffer = ""
+        self.position = 0       #position of the next unread character in buffer
+        self.consumed = 0       #number of characters read before buffer, used in error messages
+
+    #makes sure there is an unread character in buffer, returns False at the end of the file
+    def fill(self):
+        if self.position < len(self.buffer):
+            return True
+        self.consumed = self.consumed + len(self.buffer)
+        self.buffer = self.file.read(self.chunkSize)
+        self.position = 0
+        return len(self.buffer) > 0
+
+    def error(self, message):
+        return ValueError("{} at character {}".format(message, self.consumed + self.position))
+
+    #returns the next character that is not whitespace without consuming it, "" at the end of the file
+    def peek(self):
+        while self.fill():
+            c = self.buffer[self.position]
+            if not c.isspace():
+                return c
+            self.position += 1
+        return ""
+
+    #consumes and returns the next character that is not whitespace
+    def next(self):
+        c = self.peek()
+        if c == "":
+            raise self.error("Unexpected end of file")
+        self.position += 1
+        return c
+
+    def expect(self, expected):
+        if self.next() != expected:
+            self.position -= 1
+            raise self.error("Expected '{}'".format(expected))
+
+    #consumes a JSON string and returns its value
+    def readString(self):
+        self.expect('"')
+        pieces = []
+        escaped = False
+        while True:
+            if not self.fill():
+                raise self.error("Unterminated string")
+            if escaped:
+                #the character after a backslash, possibly at the start of a new chunk
+                pieces.append(self.buffer[self.position])
+                self.position += 1
+                escaped = False
+                continue
+            match = STRING_BREAK.search(self.buffer, self.position)
+            if match is None:
+                pieces.append(self.buffer[self.position:])
+                self.position = len(self.buffer)
+                continue
+            end = match.start()
+            pieces.append(self.buffer[self.position:end + 1])
+            self.position = end + 1
+            if match.group() == "\\":
+                escaped = True
+                continue
+            raw = "".join(pieces)[:-1]
+            if raw.find("\\") == -1:
+                return raw
+            return json.loads('"' + raw + '"')
+
+    #consumes any JSON value and returns it decoded
+    def readValue(self):
+        c = self.peek()
+        if c == '"':
+            return self.readString()
+        if c != "{" and c != "[":
+            #a number, true, false or null runs until the next delimiter
+            pieces = []
+            while self.fill():
+                c = self.buffer[self.position]
+                if c in ",}]" or c.isspace():
+                    break
+                pieces.append(c)
+                self.position += 1
+            return json.loads("".join(pieces))
+
+        #objects and arrays, copy text until the bracket that closes the first one
+        pieces = []
+        depth = 0
+        inString = False
+        escaped = False
+        while self.fill():
+            c = self.buffer[self.position]
+            self.position += 1
+            pieces.append(c)
+            if inString:
+                if escaped:
+                    escaped = False
+                elif c == "\\":
+                    escaped = True
+                elif c == '"':
+                    inString = False
+            elif c == '"':
+                inString = True
+            elif c == "{" or c == "[":
+                depth += 1
+            elif c == "}" or c == "]":
+                depth -= 1
+                if depth == 0:
+                    return json.loads("".join(pieces))
+        raise self.error("Unexpected end of file")
+
+#counts edges as they are loaded and reports the loading rate every every edges
+#report is called as report(edges, seconds), and defaults to printing to stderr
+class Progress:
+    def __init__(self, report = None, every = 100000):
+        self.report = report if report is not None else printProgress
+        self.every = every
+        self.edges = 0
+        self.start = time.perf_counter()
+
+    def add(self):
+        self.edges += 1
+        if self.edges % self.every == 0:
+            self.report(self.edges, time.perf_counter() - self.start)
+
+    def finish(self):
+        self.report(self.edges, time.perf_counter() - self.start)
+
+def printProgress(edges, seconds):
+    rate = edges / seconds if seconds > 0 else 0.0
+    print("{} edges loaded ({:.0f} edges/s)".format(edges, rate), file = sys.stderr)
+
+#reads the policy file filename, streaming its "relationships" section (and the relationships in
+#edgeFile, if given) into socialNetwork and nodes
+#returns the dict of the remaining sections of the policy file
+def streamPolicyFile(filename, socialNetwork, nodes, edgeFile = None, progress = None, chunkSize = 1 << 16):
+    sections = {}
+    foundRelationships = False
+    with open(filename, "r") as policyFile:
+        stream = JSONStream(policyFile, chunkSize)
+        stream.expect("{")
+        if stream.peek() == "}":
+            stream.next()
+        else:
+            while True:
+                key = stream.readString()
+                stream.expect(":")
+                if key == "relationships":
+                    streamRelationships(stream, socialNetwork, nodes, progress)
+                    foundRelationships = True
+                else:
+                    sections[key] = stream.readValue()
+                c = stream.next()
+                if c == "}":
+                    break
+                if c != ",":
+                    stream.position -= 1
+                    raise stream.error("Expected ',' or '}'")
+        if stream.peek() != "":
+            raise stream.error("Extra data")
+
+    if edgeFile is not None:
+        loadEdgeFile(edgeFile, socialNetwork, nodes, progress)
+    elif not foundRelationships:
+        raise KeyError("relationships")
+    if progress is not None:
+        progress.finish()
+    return sections
+
+#reads the relationships dictionary from stream, adding each relationship to socialNetwork as it is read
+def streamRelationships(stream, socialNetwork, nodes, progress):
+    if stream.peek() != "{":
+        raise TypeError("Relationships in policy file must take the form of a dictionary")
+    stream.next()
+    if stream.peek() == "}":
+        stream.next()
+        return
+
+    while True:
+        label = stream.readString()
+        stream.expect(":")
+        if stream.peek() != "[":
+            raise SyntaxError("Relationships in policy file improperly formatted")
+        stream.next()
+        if stream.peek() == "]":
+            stream.next()
+        else:
+            while True:
+                if stream.peek() != '"':
+                    raise SyntaxError("Relationships in policy file improperly formatted")
+                addRelationshipString(socialNetwork, nodes, label, stream.readString())
+                if progress is not None:
+                    progress.add()
+                c = stream.next()
+                if c == "]":
+                    break
+                if c != ",":
+                    stream.position -= 1
+                    raise stream.error("Expected ',' or ']'")
+
+        c = stream.next()
+        if c == "}":
+            return
+        if c != ",":
+            stream.position -= 1
+            raise stream.error("Expected ',' or '}'")
+
+#adds every relationship in the edge list file edgeFile to socialNetwork
+#each line holds <label>\t<left>\t<right>, blank lines are skipped
+def loadEdgeFile(edgeFile, socialNetwork, nodes, progress = None):
+    with open(edgeFile, "r") as edges:
+        lineNumber = 0
+        for line in edges:
+            lineNumber += 1
+            line = line.rstrip("\r\n")
+            if line.strip() == "":
+                continue
+            fields = line.split("\t")
+            if len(fields) != 3:
+                raise SyntaxError("Relationships in edge file improperly formatted on line {}: {}".format(lineNumber, line))
+            addRelationship(socialNetwork, nodes, fields[0].strip(), fields[1].strip(), fields[2].strip())
+            if progress is not None:
+                progress.add()
@@ -21,7 +21,7 @@ for file in testFiles:
     total = 0
     for a in range(0, trials):
         start = time.time()
-        hasAccess("file.txt", "Marie", "read", socialNetwork, resources, nodes)
+        hasAccess("file.txt", "Marie", "r", socialNetwork, resources, nodes)
         end = time.time()
         total = total + (end - start)
     avg = total/trials